@@ -1,3 +1,9 @@
 from .worker import Worker
 from .reader import Reader
+from .streamreader import StreamReader
 from .mydict import MyDict
+from .sharedict import SharedDict
+from .hashdict import HashDict
+from .ringbuffer import RingBuffer
+from .geoindex import GeoIndex
+from .compactdict import CompactDict
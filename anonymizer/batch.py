@@ -0,0 +1,40 @@
+from multiprocessing import Array
+from typing import NamedTuple
+
+
+class Batch(NamedTuple):
+    """
+    Lines of the logfile sent by the Reader to the Workers.
+    """
+    # position of the batch in the logfile, 0, 1, 2...
+    seq: int
+    # bytes, or a memoryview of a RingBuffer slot
+    data: object
+    # logfile of the batch, when several are read into one queue
+    fileno: int = 0
+    # time.time() the first line was read by a StreamReader, for the latency, 0 for logfiles
+    created: float = 0.0
+
+
+class FileProgress(object):
+    """
+    Batches read and done per logfile, shared by the Readers and the Workers of several logfiles. A logfile is complete
+    once its Reader finished and all its batches are done, the workers close its outputs then.
+    """
+
+    def __init__(self, files: int):
+        assert files > 0, f"invalid files: '{files}'"
+        # -1 until the reader finished
+        self._read = Array('q', [-1] * files)
+        self._done = Array('q', files)
+
+    def read(self, fileno: int, batches: int):
+        self._read[fileno] = batches
+
+    def done(self, fileno: int):
+        with self._done.get_lock():
+            self._done[fileno] += 1
+
+    def complete(self, fileno: int) -> bool:
+        read = self._read[fileno]
+        return read >= 0 and self._done[fileno] >= read
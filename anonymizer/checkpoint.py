@@ -0,0 +1,65 @@
+import json
+import os
+
+
+class Checkpoint(object):
+    """
+    Progress of a run, saved next to the logfile: the number of batches done (always the first ones, the workers are
+    held while the checkpoint is taken), the size of each worker output and index at that point, and the parameters
+    that decide how the logfile is cut into batches and written.
+    """
+
+    def __init__(self, filename: str, params: dict):
+        """
+        :param filename: checkpoint file
+        :param params: parameters of the run, a resumed run must have the same
+        """
+        self._filename = filename
+        self._params = params
+        self._batches = 0
+        self._outputs = {}
+
+    @property
+    def batches(self) -> int:
+        return self._batches
+
+    @staticmethod
+    def load(filename: str, params: dict):
+        with open(filename) as f:
+            state = json.load(f)
+        assert state['params'] == params, f"parameters differ from the checkpointed run: {state['params']}"
+        checkpoint = Checkpoint(filename, params)
+        checkpoint._batches = state['batches']
+        checkpoint._outputs = state['outputs']
+        return checkpoint
+
+    def update(self, acks: list):
+        """
+        :param acks: (worker no, output size, index size, seqs taken) of every worker, see Worker.checkpoint()
+        """
+        seqs = sorted(seq for _, _, _, taken in acks for seq in taken)
+        assert seqs == list(range(self._batches, self._batches + len(seqs))), "batches done are not contiguous"
+        self._batches += len(seqs)
+        for no, size, indexsize, _ in acks:
+            self._outputs[str(no)] = (size, indexsize)
+
+    def save(self):
+        # replaced at once, a crash leaves the previous checkpoint
+        with open(f"{self._filename}.tmp", 'w') as f:
+            json.dump({'params': self._params, 'batches': self._batches, 'outputs': self._outputs}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{self._filename}.tmp", self._filename)
+
+    def truncate(self, no: int, filename: str, indexname: str):
+        """
+        Cut the output and index of a worker back to the checkpoint, writes after it are discarded.
+        """
+        size, indexsize = self._outputs.get(str(no), (0, 0))
+        for name, length in [(filename, size), (indexname, indexsize)]:
+            with open(name, 'ab') as f:
+                f.truncate(length)
+
+    def remove(self):
+        if os.path.exists(self._filename):
+            os.remove(self._filename)
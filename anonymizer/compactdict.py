@@ -0,0 +1,55 @@
+from threading import Lock
+from .hashtable import HashTable
+
+
+class CompactDict(HashTable):
+    """
+    Key to id mapping in private flat buffers (see HashTable), a drop-in for MyDict in the manager processes. A key
+    costs its utf-8 bytes and 32 bytes of arrays, instead of two str objects and a dict entry. The buffers grow by half
+    when full.
+    """
+
+    # growth factor of the entries and the arena
+    _GROWTH = 1.5
+
+    def __init__(self, capacity: int = 1 << 16, arenasize: int = 1 << 20):
+        """
+        :param capacity: initial number of index slots
+        :param arenasize: initial bytes reserved for the keys
+        """
+        assert arenasize > 0, f"invalid arenasize: '{arenasize}'"
+        super().__init__(capacity)
+        # the manager serves every worker on a thread of its own
+        self._lock = Lock()
+        self._carve(memoryview(bytearray(self._tablebytes())), memoryview(bytearray(arenasize)))
+
+    def _grow(self, entries: int, used: int):
+        # new buffers are swapped in, lookups running meanwhile see a consistent (if stale) table, see _carve()
+        arena = self._arena
+        if used > len(arena):
+            size = len(arena)
+            while used > size:
+                size = int(size * self._GROWTH) + 1
+            arena = memoryview(bytearray(size))
+            arena[:len(self._arena)] = self._arena
+
+        table = self._buffer
+        if entries > self._maxentries:
+            count = self._header[0]
+            old = self._views()[:6]
+            oldcapacity = self._capacity
+            self._maxentries = int(self._maxentries * self._GROWTH) + 1
+            while self._maxentries > self._capacity * self._MAXLOAD:
+                self._capacity *= 2
+
+            # filled before it is swapped in
+            table = memoryview(bytearray(self._tablebytes()))
+            new = self._split(table)
+            new[0][:] = old[0]
+            for view, oldview in zip(new[1:5], old[1:5]):
+                view[:count] = oldview[:count]
+            if self._capacity == oldcapacity:
+                new[5][:] = old[5]
+            else:
+                self._reindex(new[5], new[1], count)
+        self._carve(table, arena)
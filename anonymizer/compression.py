@@ -0,0 +1,110 @@
+import bz2
+import gzip
+import lzma
+import os
+from queue import Queue
+from threading import Thread
+from time import perf_counter
+from .metrics import Metrics
+
+# codec: (file extension, open for writing, default level, open for reading), appending starts a new stream, the
+# decompressors read concatenated streams as one
+CODECS = {
+    'bz2': ('.bz2', lambda filename, level, mode: bz2.open(filename, mode, compresslevel=level), 9, bz2.open),
+    'gzip': ('.gz', lambda filename, level, mode: gzip.open(filename, mode, compresslevel=level), 6, gzip.open),
+    'lzma': ('.xz', lambda filename, level, mode: lzma.open(filename, mode, preset=level), 6, lzma.open),
+    'none': ('', lambda filename, level, mode: open(filename, mode), None, open),
+}
+
+
+def open_compressed(filename: str, codec: str, level: int = None, append: bool = False):
+    """
+    :param level: compression level of the codec, None for its default
+    :param append: add a new stream to the end of the file
+    :return: binary file object for writing
+    """
+    assert codec in CODECS, f"invalid codec: '{codec}'"
+    _, opener, default, _ = CODECS[codec]
+    return opener(filename, default if level is None else level, 'ab' if append else 'wb')
+
+
+def open_decompressed(filename: str, codec: str):
+    """
+    :return: binary file object for reading
+    """
+    assert codec in CODECS, f"invalid codec: '{codec}'"
+    return CODECS[codec][3](filename, 'rb')
+
+
+class BackgroundWriter(object):
+    """
+    Compresses and writes on a thread, the caller prepares the next buffer meanwhile (the compressors release the GIL).
+    One buffer is queued while the previous one is compressed, write() blocks if the thread falls behind.
+    """
+
+    def __init__(self, filename: str, codec: str, level: int = None, append: bool = False, metrics: Metrics = None):
+        """
+        :param metrics: gets the seconds of the thread per buffer (stage compression) and the seconds write() waited
+        """
+        self._filename = filename
+        self._codec = codec
+        self._level = level
+        self._file = open_compressed(filename, codec, level, append)
+        self._queue = Queue(maxsize=1)
+        self._error = None
+        self._metrics = metrics
+        self._thread = Thread(target=self._run, name=f"Writer-{filename}", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _run(self):
+        while (data := self._queue.get()) is not None:
+            if self._error is None:
+                try:
+                    start = perf_counter()
+                    self._file.write(data)
+                    if self._metrics is not None:
+                        self._metrics.record('compression', perf_counter() - start)
+                        self._metrics.add('compression_bytes', len(data))
+                except Exception as e:
+                    # raised in the caller on the next write or close, keep draining the queue
+                    self._error = e
+            self._queue.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, data: bytes):
+        self._check()
+        start = perf_counter()
+        self._queue.put(data)
+        if self._metrics is not None:
+            self._metrics.add('compression_blocked_seconds', perf_counter() - start)
+
+    def restart(self) -> int:
+        """
+        Wait for the queued buffers, end the compressed stream, sync it to disk, continue in a new stream.
+
+        :return: file size, a boundary the file can be truncated to
+        """
+        self._queue.join()
+        self._check()
+        self._file.close()
+        with open(self._filename, 'ab') as f:
+            os.fsync(f.fileno())
+            size = f.tell()
+        self._file = open_compressed(self._filename, self._codec, self._level, append=True)
+        return size
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._file.close()
+        self._check()
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import time
+from itertools import islice
+from cachetools import LRUCache
+
+
+class DiskCache(object):
+    """
+    Persistent key -> value table in an sqlite database (WAL mode, any number of processes read concurrently, writes
+    are serialized by sqlite). Values are stored as json. Least recently used entries are evicted above maxsize.
+    """
+
+    # sqlite limits the number of host parameters in a statement
+    _BATCH = 500
+
+    # resolution of the access times in seconds, hits on entries touched within it write nothing
+    _TOUCH = 3600
+
+    def __init__(self, filename: str, table: str, maxsize: int):
+        """
+        :param filename: sqlite database, created if missing
+        :param table: one table per cached function
+        :param maxsize: maximum number of entries in the table
+        """
+        assert table.isidentifier(), f"invalid table: '{table}'"
+        assert maxsize > 0, f"invalid maxsize: '{maxsize}'"
+        self._table = table
+        self._maxsize = maxsize
+
+        self._db = sqlite3.connect(filename, timeout=60, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, atime INTEGER)")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_atime ON {table} (atime)")
+
+        # entries added since the last eviction
+        self._added = 0
+
+    def get_many(self, keys: list) -> dict:
+        """
+        :return: {key: value} of the keys found, their access time is updated if older than _TOUCH
+        """
+        found = {}
+        stale = []
+        now = int(time.time())
+        it = iter(keys)
+        while batch := list(islice(it, self._BATCH)):
+            rows = self._db.execute(
+                f"SELECT key, value, atime FROM {self._table} WHERE key IN ({','.join('?' * len(batch))})", batch)
+            for key, value, atime in rows:
+                found[key] = json.loads(value)
+                if atime < now - self._TOUCH:
+                    stale.append(key)
+
+        if stale:
+            self._write(f"UPDATE {self._table} SET atime = ? WHERE key = ?", ((now, key) for key in stale))
+        return found
+
+    def put_many(self, items: dict):
+        now = int(time.time())
+        self._write(f"INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?)",
+                    ((key, json.dumps(value), now) for key, value in items.items()))
+
+        # evicting is a full index scan, do it once a tenth of the table is new
+        self._added += len(items)
+        if self._added > self._maxsize // 10:
+            self.evict()
+
+    def _write(self, sql: str, rows):
+        # one transaction, one lock of the database for all rows
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany(sql, rows)
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def evict(self):
+        self._db.execute(f"DELETE FROM {self._table} WHERE key IN "
+                         f"(SELECT key FROM {self._table} ORDER BY atime DESC LIMIT -1 OFFSET ?)", (self._maxsize,))
+        self._added = 0
+
+    def __len__(self):
+        return self._db.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+    def close(self):
+        self.evict()
+        self._db.close()
+
+
+class TieredCache(object):
+    """
+    Memoizes func for many keys at once: a bounded in-process LRU cache, then an optional DiskCache shared by the
+    processes and kept between runs, func is called for the remaining keys only.
+    """
+
+    def __init__(self, func, cachesize: int, disk: DiskCache = None):
+        """
+        :param func: function of one key, the result must be json serializable
+        :param cachesize: size of the in-process LRU cache, 0 disables it
+        """
+        assert cachesize >= 0, f"invalid cachesize: '{cachesize}'"
+        self._func = func
+        self._memory = LRUCache(maxsize=cachesize)
+        self._disk = disk
+
+        self.hits = 0
+        self.diskhits = 0
+        self.misses = 0
+
+    def map_many(self, keys) -> list:
+        values = {}
+        missing = []
+        for key in keys:
+            if key in self._memory:
+                values[key] = self._memory[key]
+            else:
+                missing.append(key)
+        self.hits += len(values)
+
+        if missing:
+            found = self._disk.get_many(missing) if self._disk is not None else {}
+            self.diskhits += len(found)
+
+            computed = {key: self._func(key) for key in missing if key not in found}
+            self.misses += len(computed)
+            if computed and self._disk is not None:
+                self._disk.put_many(computed)
+
+            found.update(computed)
+            if self._memory.maxsize > 0:
+                self._memory.update(found)
+            values.update(found)
+
+        return [values[key] for key in keys]
+
+    def stats(self) -> str:
+        total = self.hits + self.diskhits + self.misses
+        return f"{total} lookups, {self.hits} memory hits, {self.diskhits} disk hits, {self.misses} misses " \
+               f"({(self.hits + self.diskhits) / total if total else 0:.1%} hit rate)"
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
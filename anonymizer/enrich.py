@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+from ua_parser import user_agent_parser
+
+# columns derived from the user agent
+UACOLUMNS = ['devicebrand', 'devicefamily', 'devicemodel', 'osfamily', 'uafamily', 'uamajor']
+
+# columns derived from the path
+PATHCOLUMNS = ['livechannel', 'contentpackage', 'assetnumber', 'manifest', 'fragment']
+
+
+def unique_apply(column: pd.Series, func):
+    """
+    Evaluate func on the distinct values of column only, and expand the result back to the rows with a single take.
+
+    :param column: source column
+    :param func: called with a Series of the distinct values (NaN excluded), returns a Series or DataFrame with the
+    same index
+    :return: Series or DataFrame with the index of column, NaN where column is NaN
+    """
+    codes, uniques = pd.factorize(column)
+    result = func(pd.Series(uniques, dtype=object))
+
+    # code -1 (NaN) is not in the index of the result, reindex fills it with NaN
+    expanded = result.reindex(codes)
+    expanded.index = column.index
+    return expanded
+
+
+def host(hosts: pd.Series) -> pd.Series:
+    # remove cache name, if present in host (http redirect)
+    hosts = hosts.str.replace(r'^[a-zA-Z0-9-]+--', '', regex=True)
+    return hosts.str.replace(r'^[a-zA-Z0-9]+-[a-zA-Z0-9]+-[a-zA-Z0-9]+\.', '', regex=True)
+
+
+def path(paths: pd.Series) -> pd.DataFrame:
+    result = pd.DataFrame(index=paths.index)
+
+    # channel number (.fillna().sum() takes care of the OR case in the regexp)
+    result['livechannel'] = paths.str.extract(r'PLTV/88888888/\d+/(\d+)/|([^/]+)\.isml',
+                                              expand=False).fillna('').sum(axis=1).replace('', np.nan)
+
+    # contentpackage, assetid
+    dummy = paths.str.extract(r"/(\d{18,})/(\d{16,})/")
+    result['contentpackage'] = dummy[0]
+    result['assetnumber'] = dummy[1]
+
+    # streaming protocol
+    result['manifest'] = paths.str.match(r'(?:\.isml?/Manifest|\.mpd|\.m3u8)$', case=False)
+    result['fragment'] = paths.str.match(
+        r'(?:\.m4[avi]|\.ts|\.ism[av]|\.mp[4a]|/(?:Fragments|KeyFrames)\(.*\))$', case=False)
+
+    return result
+
+
+def session(cookies: pd.Series) -> pd.DataFrame:
+    dummy = cookies.str.extract(r"session=(?:-|([^,]+)),(?:-|([^,]+)),(?:-|([^,]+)),(?:-|([^,;]+))", expand=True)
+    return pd.DataFrame({'uid': dummy[0], 'sid': dummy[1]}, index=cookies.index)
+
+
+def useragent(ua_string: str) -> list:
+    """
+    :return: values of UACOLUMNS
+    """
+    ps = user_agent_parser.Parse(ua_string)
+    return [np.nan if x is None else x for x in
+            [ps['device']['brand'], ps['device']['family'], ps['device']['model'], ps['os']['family'],
+             ps['user_agent']['family'], ps['user_agent']['major']]]
+
+
+def location(geodata):
+    # round up to 2 digits (~1km precision, see https://wiki.openstreetmap.org/wiki/Precision_of_coordinates)
+    return f"{round(geodata['location']['longitude'], 2)}:{round(geodata['location']['latitude'], 2)}" if geodata is not None and 'location' in geodata else np.nan
+
+
+def coordinates(geo, ip: str):
+    return location(geo.get(ip))
@@ -0,0 +1,139 @@
+import json
+import os
+import socket
+import numpy as np
+import pandas as pd
+from .enrich import location
+
+# IPv4 addresses are stored as IPv4-mapped IPv6 addresses (::ffff:a.b.c.d), one table covers both families
+_V4MAPPED = b'\x00' * 10 + b'\xff' * 2
+
+# (prefix, offset of the IPv4 address): IPv4-compatible ::/96, 6to4 2002::/16, Teredo 2001::/32
+_V4ALIASES = [(b'\x00' * 12, 12), (b'\x20\x02', 2), (b'\x20\x01\x00\x00', 4)]
+
+_MAGIC = b'GEOINDEX'
+
+
+class GeoIndex(object):
+    """
+    GeoIP lookup in a sorted interval table (start, end, coordinates id) built from the GeoLite2 database. Networks
+    without location are left out, adjacent networks with the same coordinates are merged. The table is mapped from a
+    file, workers share the pages instead of loading the database each.
+    """
+
+    def __init__(self, filename: str):
+        """
+        :param filename: index file, see build()
+        """
+        header, offset = self._header(filename)
+        entries = header['entries']
+        self._starts = np.memmap(filename, dtype='S16', mode='r', offset=offset, shape=(entries,))
+        offset += 16 * entries
+        self._ends = np.memmap(filename, dtype='S16', mode='r', offset=offset, shape=(entries,))
+        offset += 16 * entries
+        self._ids = np.memmap(filename, dtype='<i4', mode='r', offset=offset, shape=(entries,))
+
+        # id -1 (not found) picks the NaN at the end
+        self._labels = np.array(header['labels'] + [np.nan], dtype=object)
+
+    @staticmethod
+    def _header(filename: str):
+        """
+        :return: (header, offset of the arrays)
+        """
+        with open(filename, 'rb') as f:
+            assert f.read(len(_MAGIC)) == _MAGIC, f"not a geoindex file: '{filename}'"
+            size = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(size))
+        offset = len(_MAGIC) + 8 + size
+        return header, offset + (-offset % 16)
+
+    @staticmethod
+    def key(ip) -> bytes:
+        """
+        :return: 16 byte big endian address, None if ip is not a valid address
+        """
+        try:
+            if ':' not in ip:
+                return _V4MAPPED + socket.inet_pton(socket.AF_INET, ip)
+            packed = socket.inet_pton(socket.AF_INET6, ip)
+        except (OSError, TypeError):
+            return None
+
+        # the database aliases these to the IPv4 networks
+        for prefix, v4 in _V4ALIASES:
+            if packed.startswith(prefix):
+                return _V4MAPPED + packed[v4:v4 + 4]
+        return packed
+
+    def coordinates(self, ips: pd.Series) -> pd.Series:
+        """
+        Same result as enrich.coordinates(), for all addresses with a single search.
+        """
+        keys = [self.key(ip) for ip in ips]
+        valid = np.array([k is not None for k in keys], dtype=bool)
+        keys = np.array([k if k is not None else b'' for k in keys], dtype='S16')
+
+        # first network ending at or after the address, found if it starts at or before
+        i = np.minimum(np.searchsorted(self._ends, keys), len(self._ends) - 1)
+        found = valid & (self._starts[i] <= keys) & (keys <= self._ends[i])
+        ids = np.where(found, self._ids[i], -1)
+
+        return pd.Series(self._labels[ids], index=ips.index, dtype=object)
+
+    @staticmethod
+    def is_current(filename: str, reader) -> bool:
+        """
+        :param reader: maxminddb reader of the GeoLite2 database
+        :return: True, if filename is an index of the database loaded by reader
+        """
+        try:
+            header, _ = GeoIndex._header(filename)
+        except (FileNotFoundError, AssertionError):
+            return False
+        return header['build_epoch'] == reader.metadata().build_epoch
+
+    @staticmethod
+    def build(filename: str, reader):
+        """
+        Walk every network of the database and write the index file (replaced atomically).
+
+        :param reader: maxminddb reader of the GeoLite2 database
+        """
+        labels = {}
+        networks = []
+        for network, record in reader:
+            label = location(record)
+            if pd.isna(label):
+                continue
+            start = int(network.network_address)
+            end = int(network.broadcast_address)
+            if network.version == 4:
+                start += 0xffff00000000
+                end += 0xffff00000000
+            networks.append((start, end, labels.setdefault(label, len(labels))))
+        networks.sort()
+
+        # merge adjacent networks with the same coordinates
+        merged = []
+        for start, end, id in networks:
+            if merged and merged[-1][2] == id and merged[-1][1] + 1 == start:
+                merged[-1][1] = end
+            else:
+                assert not merged or merged[-1][1] < start, f"overlapping networks at {start:x}"
+                merged.append([start, end, id])
+        assert len(merged) > 0, "no networks with location in the database"
+
+        header = json.dumps({'entries': len(merged), 'labels': list(labels),
+                             'build_epoch': reader.metadata().build_epoch}).encode('utf-8')
+
+        tmpname = f"{filename}.tmp"
+        with open(tmpname, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            f.write(b'\x00' * (-f.tell() % 16))
+            f.write(np.array([start.to_bytes(16, 'big') for start, _, _ in merged], dtype='S16').tobytes())
+            f.write(np.array([end.to_bytes(16, 'big') for _, end, _ in merged], dtype='S16').tobytes())
+            f.write(np.array([id for _, _, id in merged], dtype='<i4').tobytes())
+        os.replace(tmpname, filename)
@@ -0,0 +1,63 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import logging
+
+
+class HashDict(object):
+    """
+    Stateless substitution with a keyed hash (blake2b, personalized with the prefix), nothing to share or to save.
+    Keys found in the lookup (converted from a secrets file, see convert_secrets.py) keep their published ids.
+    """
+
+    # digest length in bytes stored in the lookup files, truncated to hashlen on load
+    DIGEST_SIZE = 32
+
+    def __init__(self, key: bytes, prefix: str, hashlen: int):
+        """
+        :param key: secret key, at most 64 bytes
+        :param prefix: mapper prefix, separates the hash domains of the columns
+        :param hashlen: length of the hash in bytes (hex encoded)
+        """
+        assert 0 < len(key) <= 64, f"invalid key length: '{len(key)}'"
+        assert 0 < len(prefix.encode('utf-8')) <= 16, f"invalid prefix: '{prefix}'"
+        assert 0 < hashlen <= self.DIGEST_SIZE, f"invalid hashlen: '{hashlen}'"
+        self._key = key
+        self._person = prefix.encode('utf-8')
+        self._hashlen = hashlen
+        self._lookup = {}
+
+    def digest(self, key) -> str:
+        return hashlib.blake2b(str(key).encode('utf-8'), digest_size=self.DIGEST_SIZE, key=self._key,
+                               person=self._person).hexdigest()
+
+    def map(self, key):
+        if key is None:
+            return np.nan
+
+        h = self.digest(key)[:2 * self._hashlen]
+        return self._lookup.get(h, h)
+
+    def map_many(self, keys) -> list:
+        return [self.map(key) for key in keys]
+
+    def save(self, filename: str):
+        # stateless, nothing to save
+        pass
+
+    def load(self, filename: str):
+        try:
+            lookup = pd.read_csv(filename, header=None, dtype=str).set_index(0).to_dict()[1]
+            self._lookup = {h[:2 * self._hashlen]: id for h, id in lookup.items()}
+        except FileNotFoundError:
+            logging.info(f"Lookup file {filename} not found, using hashes only.")
+        except pd.errors.EmptyDataError:
+            logging.info(f"Lookup file {filename} is empty, using hashes only.")
+
+    def convert(self, secretsfile: str, lookupfile: str):
+        """
+        Convert a secrets file (key, id) into a lookup file (digest, id), the lookup does not contain the keys.
+        """
+        secrets = pd.read_csv(secretsfile, header=None, na_values='-').astype(str)
+        secrets[0] = secrets[0].map(self.digest)
+        secrets.to_csv(lookupfile, header=False, index=False)
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+import numpy as np
+import pandas as pd
+from . import journal
+
+
+class HashTable(object):
+    """
+    Key to id mapping in flat buffers: entries are appended to arrays (key hash, arena offset, key length, id) and the
+    key bytes to an arena, an index of entry numbers finds them (open addressing, linear probing). Existing keys are
+    looked up without locking, only unseen keys take the locked insert path. The entry is written first, its number in
+    the index last, a non-zero index publishes it.
+
+    Layout of the table buffer: header | hashes | offsets | ids | lengths | index. The subclass allocates the table
+    (see _tablebytes()) and the arena, hands them to _carve(), and provides self._lock.
+    """
+
+    # header: entries, arena bytes used
+    _HEADER = 2
+    # grow (or refuse inserts) above this load factor of the index, keeps the probe sequences short
+    _MAXLOAD = 0.75
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: number of index slots, the entries are limited to _MAXLOAD of it
+        """
+        assert capacity > 0, f"invalid capacity: '{capacity}'"
+        self._capacity = capacity
+        self._maxentries = max(1, int(capacity * self._MAXLOAD))
+        # ids below this are in the journal, the new ones are appended on save
+        self._saved = 0
+
+    def _tablebytes(self) -> int:
+        return 8 * (self._HEADER + 3 * self._maxentries) + 4 * (self._maxentries + self._capacity)
+
+    def _split(self, table: memoryview) -> list:
+        """
+        :return: views of header, hashes, offsets, ids, lengths and index in the table buffer
+        """
+        bounds = np.cumsum([0, 8 * self._HEADER] + [8 * self._maxentries] * 3 + [4 * self._maxentries,
+                                                                                 4 * self._capacity]).tolist()
+        return [table[a:b].cast('q' if n < 4 else 'i') for n, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+    def _carve(self, table: memoryview, arena: memoryview):
+        """
+        Set up the views of the table and the arena buffers.
+        """
+        header, hashes, offsets, ids, lengths, index = self._split(table)
+        self._buffer = table
+        self._header = header
+        self._hashes, self._offsets, self._ids, self._lengths = hashes, offsets, ids, lengths
+        self._arena = arena
+        # the index last, lookups on a grown table find the entries and the arena in place
+        self._index = index
+
+    def _views(self) -> list:
+        return [self._header, self._hashes, self._offsets, self._ids, self._lengths, self._index, self._arena]
+
+    @staticmethod
+    def _hash(data: bytes) -> int:
+        # stable over processes (unlike hash())
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True)
+
+    def _find(self, data: bytes, h: int):
+        """
+        :return: (slot, id), id is None if key is not present, slot is the empty slot to insert into
+        """
+        # capacity from the index itself, a grown index is swapped in at once
+        index = self._index
+        capacity = len(index)
+        slot = h % capacity
+        while True:
+            entry = index[slot] - 1
+            if entry < 0:
+                return slot, None
+            if self._hashes[entry] == h:
+                offset = self._offsets[entry]
+                if self._arena[offset:offset + self._lengths[entry]] == data:
+                    return slot, self._ids[entry]
+            slot = (slot + 1) % capacity
+
+    def _grow(self, entries: int, used: int):
+        """
+        Make room for entries keys of used bytes in total, called with the lock held.
+        """
+        raise MemoryError(f"{type(self).__name__} full: {entries} entries for {self._maxentries}, "
+                          f"{used} bytes in an arena of {len(self._arena)}")
+
+    @staticmethod
+    def _reindex(index: memoryview, hashes: memoryview, count: int):
+        """
+        Fill an empty index of a grown table with the first count entries.
+        """
+        capacity = len(index)
+        for entry, h in enumerate(np.frombuffer(hashes, dtype=np.int64, count=count).tolist()):
+            slot = h % capacity
+            while index[slot] != 0:
+                slot = (slot + 1) % capacity
+            index[slot] = entry + 1
+
+    def _insert(self, data: bytes, h: int, id: int = None) -> int:
+        # caller holds the lock
+        slot, found = self._find(data, h)
+        if found is not None:
+            return found
+
+        entries, used = self._header[0], self._header[1]
+        if entries + 1 > self._maxentries or used + len(data) > len(self._arena):
+            self._grow(entries + 1, used + len(data))
+            slot, _ = self._find(data, h)
+
+        if id is None:
+            id = entries
+
+        self._arena[used:used + len(data)] = data
+        self._hashes[entries] = h
+        self._offsets[entries] = used
+        self._lengths[entries] = len(data)
+        self._ids[entries] = id
+        # publish
+        self._index[slot] = entries + 1
+        self._header[1] = used + len(data)
+        self._header[0] = entries + 1
+        return id
+
+    def map(self, key):
+        if key is None:
+            return np.nan
+
+        data = str(key).encode('utf-8')
+        h = self._hash(data)
+
+        # fast path, no lock
+        slot, id = self._find(data, h)
+        if id is None:
+            with self._lock:
+                id = self._insert(data, h)
+        return str(id)
+
+    def map_many(self, keys) -> list:
+        return [self.map(key) for key in keys]
+
+    def __len__(self):
+        return self._header[0]
+
+    def _items(self, since: int = 0) -> list:
+        """
+        :return: list of (key bytes, id) with id >= since, sorted by id
+        """
+        entries = self._header[0]
+        ids = np.frombuffer(self._ids, dtype=np.int64, count=entries)
+        order = np.flatnonzero(ids >= since)
+        order = order[np.argsort(ids[order], kind='stable')]
+        offsets = np.frombuffer(self._offsets, dtype=np.int64, count=entries)[order].tolist()
+        lengths = np.frombuffer(self._lengths, dtype=np.int32, count=entries)[order].tolist()
+        return [(bytes(self._arena[offset:offset + length]), id)
+                for offset, length, id in zip(offsets, lengths, ids[order].tolist())]
+
+    def items(self):
+        """
+        :return: list of (key, id) sorted by id
+        """
+        return [(key.decode('utf-8'), id) for key, id in self._items()]
+
+    def save(self, filename: str):
+        """
+        :param filename: journal (see journal.py), only the new entries are appended, or csv, rewritten
+        """
+        if journal.isjournal(filename):
+            new = self._items(self._saved)
+            journal.append(filename, [key for key, _ in new], [id for _, id in new])
+            if new:
+                self._saved = new[-1][1] + 1
+            return
+
+        # replaced at once, a crash leaves the previous file
+        pd.DataFrame.from_dict(data={key: str(id) for key, id in self.items()}, orient='index', dtype=object).to_csv(
+            f"{filename}.tmp", header=False, na_rep='-')
+        os.replace(f"{filename}.tmp", filename)
+
+    def load(self, filename: str):
+        try:
+            if journal.isjournal(filename):
+                with self._lock:
+                    for keys, ids in journal.read(filename):
+                        for data, id in zip(keys, ids.tolist()):
+                            self._insert(data, self._hash(data), id)
+                        if len(ids) > 0:
+                            self._saved = max(self._saved, int(ids.max()) + 1)
+                return
+            mapping = pd.read_csv(filename, header=None, na_values='-').astype(str).set_index(0).to_dict()[1]
+        except FileNotFoundError:
+            logging.warning(f"Secret file {filename} not found, using empty dict.")
+            return
+        except pd.errors.EmptyDataError:
+            logging.warning(f"Secret file {filename} is empty, using empty dict.")
+            return
+
+        with self._lock:
+            for key, id in mapping.items():
+                data = str(key).encode('utf-8')
+                self._insert(data, self._hash(data), int(id))
@@ -0,0 +1,137 @@
+import logging
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+
+# secrets files with this extension are journals, others csv
+EXTENSION = '.journal'
+
+# compact() once a journal has this many blocks
+MAXBLOCKS = 64
+
+_MAGIC = b'JOURNAL1'
+
+# block header: entries, payload bytes, crc32 of the payload
+_BLOCK = struct.Struct('<QQI')
+
+
+def isjournal(filename: str) -> bool:
+    return filename.endswith(EXTENSION)
+
+
+def _blocks(mm):
+    """
+    :return: generator of (entries, payload start, payload size, crc) of the blocks with a complete payload
+    """
+    offset = len(_MAGIC)
+    while offset + _BLOCK.size <= len(mm):
+        entries, size, crc = _BLOCK.unpack_from(mm, offset)
+        start = offset + _BLOCK.size
+        if size < 12 * entries or start + size > len(mm):
+            break
+        yield entries, start, size, crc
+        offset = start + size
+
+
+def _open(f):
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    assert mm[:len(_MAGIC)] == _MAGIC, f"not a journal file: '{f.name}'"
+    return mm
+
+
+def read(filename: str):
+    """
+    Reads the blocks from a memory map, a block cut short or corrupted by a crash ends the journal.
+
+    :return: generator of (keys as bytes, ids as int64 array), one per block in the order written
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with _open(f) as mm:
+            end = len(_MAGIC)
+            for entries, start, size, crc in _blocks(mm):
+                payload = mm[start:start + size]
+                if zlib.crc32(payload) != crc:
+                    break
+                end = start + size
+
+                # ids, key lengths, keys back to back
+                ids = np.frombuffer(payload, dtype='<i8', count=entries)
+                ends = np.cumsum(np.frombuffer(payload, dtype='<u4', count=entries, offset=8 * entries),
+                                 dtype=np.int64) + 12 * entries
+                starts = np.concatenate([[12 * entries], ends[:-1]])
+                yield [payload[a:b] for a, b in zip(starts.tolist(), ends.tolist())], ids
+
+            if end < len(mm):
+                logging.warning(f"Journal {filename}: {len(mm) - end} bytes after the last intact block ignored")
+
+
+def blocks(filename: str) -> int:
+    try:
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0
+            with _open(f) as mm:
+                return sum(1 for _ in _blocks(mm))
+    except FileNotFoundError:
+        return 0
+
+
+def _end(f) -> int:
+    """
+    :return: end of the last intact block, only the last one can be torn (see append())
+    """
+    with _open(f) as mm:
+        end = last = len(_MAGIC)
+        for entries, start, size, crc in _blocks(mm):
+            last, end = end, (start + size)
+        if end > len(_MAGIC) and zlib.crc32(mm[end - size:end]) != crc:
+            end = last
+        return end
+
+
+def _block(keys: list, ids) -> bytes:
+    lengths = np.fromiter(map(len, keys), dtype='<u4', count=len(keys))
+    payload = np.asarray(ids, dtype='<i8').tobytes() + lengths.tobytes() + b"".join(keys)
+    return _BLOCK.pack(len(keys), len(payload), zlib.crc32(payload)) + payload
+
+
+def append(filename: str, keys: list, ids):
+    """
+    Add one block and sync it, a torn block left by a crash is cut off first.
+
+    :param keys: utf-8 encoded keys
+    :param ids: ids of the keys
+    """
+    assert len(keys) == len(ids), f"{len(keys)} keys with {len(ids)} ids"
+    if len(keys) == 0:
+        return
+    with open(filename, 'a+b') as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            f.write(_MAGIC)
+        else:
+            f.truncate(_end(f))
+            f.seek(0, os.SEEK_END)
+        f.write(_block(keys, ids))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def compact(filename: str):
+    """
+    Rewrite the journal as one block ordered by id, the last id of a key wins. Replaced at once.
+    """
+    mapping = {}
+    for keys, ids in read(filename):
+        mapping.update(zip(keys, ids.tolist()))
+    items = sorted(mapping.items(), key=lambda item: item[1])
+
+    with open(f"{filename}.tmp", 'wb') as f:
+        f.write(_MAGIC)
+        f.write(_block([key for key, _ in items], [id for _, id in items]))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{filename}.tmp", filename)
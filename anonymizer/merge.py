@@ -0,0 +1,75 @@
+import heapq
+import logging
+from itertools import count
+from .sink import SINKS, CsvSink
+
+
+def merge(filenames: list, output: str, sink: str = 'csv', compression: str = 'bz2', compresslevel: int = None,
+          by: str = 'seq', window: int = 1000000):
+    """
+    K-way merge of the worker outputs into one file. Every worker takes the batches in increasing seq, so each file is
+    ordered by seq already; one batch per file is held in memory.
+
+    :param filenames: worker outputs, written by the sink
+    :param output: merged file
+    :param by: 'seq' restores the order of the logfile, 'timestamp' orders the rows by #timestamp (csv only)
+    :param window: for 'timestamp', rows held back for reordering, rows displaced farther than this in the logfile
+    stay out of order (counted and logged)
+    """
+    assert sink in SINKS, f"invalid sink: '{sink}'"
+    assert by in ['seq', 'timestamp'], f"invalid order: '{by}'"
+    assert by == 'seq' or SINKS[sink] is CsvSink, f"ordering by timestamp is implemented for csv only, not '{sink}'"
+    assert window > 0, f"invalid window: '{window}'"
+
+    segments = heapq.merge(*[SINKS[sink].segments(filename, compression) for filename in filenames],
+                           key=lambda segment: segment[0])
+    writer = SINKS[sink].concat(output, compression, compresslevel)
+    try:
+        if by == 'seq':
+            batches = missing = 0
+            for seq, segment in segments:
+                # skipped batches leave gaps
+                missing += seq - batches
+                batches = seq + 1
+                writer.write(segment)
+            if missing > 0:
+                logging.warning(f"{missing} batches missing in {output}, skipped by the workers")
+        else:
+            late = _by_timestamp(segments, writer, window)
+            if late > 0:
+                logging.warning(f"{late} rows out of order in {output}, consider a larger window")
+    finally:
+        writer.close()
+
+
+def _by_timestamp(segments, writer, window: int) -> int:
+    """
+    Reorder the csv rows in a heap of window rows, the first field is #timestamp in a sortable format.
+
+    :return: number of rows written out of order
+    """
+    heap = []
+    order = count()
+    late = 0
+    last = b''
+    header = None
+    for seq, (header, lines) in segments:
+        assert header.startswith(b'#timestamp,'), f"unexpected header: '{header}'"
+        out = []
+        for line in lines:
+            # the counter keeps the logfile order of equal timestamps
+            item = (line.split(b',', 1)[0], next(order), line)
+            if len(heap) < window:
+                heapq.heappush(heap, item)
+                continue
+            key, _, line = heapq.heappushpop(heap, item)
+            if key < last:
+                late += 1
+            else:
+                last = key
+            out.append(line)
+        writer.write((header, out))
+
+    if header is not None:
+        writer.write((header, [line for _, _, line in sorted(heap)]))
+    return late
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from queue import Empty
+from threading import Lock
+from time import perf_counter, monotonic, time
+import json
+import os
+
+# prefix of the Prometheus metric names
+NAMESPACE = 'logprocessor'
+
+
+class Metrics(object):
+    """
+    Figures of a process: seconds and rows per stage, counters and gauges. Sent to the main process every interval
+    seconds through a queue (see Exporter), or only kept if there is none.
+    """
+
+    def __init__(self, name: str, queue=None, interval: float = 10):
+        """
+        :param name: of the process
+        :param queue: multiprocessing Queue to the Exporter
+        """
+        assert interval > 0, f"invalid interval: '{interval}'"
+        self._name = name
+        self._queue = queue
+        self._interval = interval
+        self._lastsent = monotonic()
+
+        self._seconds = defaultdict(float)
+        self._rows = defaultdict(int)
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._watched = {}
+
+        # stages are recorded by the writer threads as well
+        self._lock = Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0):
+        """
+        Time the code in the with block.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - start, rows)
+
+    def record(self, name: str, seconds: float, rows: int = 0):
+        with self._lock:
+            self._seconds[name] += seconds
+            self._rows[name] += rows
+
+    def add(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set(self, name: str, value: float):
+        self._gauges[name] = value
+
+    def watch(self, name: str, func, gauge: bool = False):
+        """
+        :param func: returns the current value of a counter (or gauge) kept elsewhere, read by snapshot()
+        """
+        self._watched[name] = (func, gauge)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {'seconds': dict(self._seconds), 'rows': dict(self._rows), 'counters': dict(self._counters),
+                        'gauges': dict(self._gauges)}
+        for name, (func, gauge) in self._watched.items():
+            snapshot['gauges' if gauge else 'counters'][name] = func()
+        return snapshot
+
+    def send(self, force: bool = False):
+        """
+        Send a snapshot if interval seconds passed since the last one.
+        """
+        if self._queue is None or (not force and monotonic() - self._lastsent < self._interval):
+            return
+        self._queue.put((self._name, self.snapshot()))
+        self._lastsent = monotonic()
+
+
+class Exporter(object):
+    """
+    Keeps the latest snapshot of every process and writes them every interval seconds, to a JSON file with the totals
+    per role (Reader, Worker, ...) or, if the filename ends with .prom, to a Prometheus textfile (see the textfile
+    collector of the node exporter). The file is replaced atomically.
+    """
+
+    def __init__(self, filename: str, queue, interval: float = 10):
+        assert interval > 0, f"invalid interval: '{interval}'"
+        self._filename = filename
+        self._queue = queue
+        self._interval = interval
+        self._started = time()
+        self._lastexport = monotonic()
+        self._snapshots = {}
+
+    def collect(self):
+        """
+        Take the snapshots queued, the processes can not exit before.
+        """
+        while True:
+            try:
+                name, snapshot = self._queue.get_nowait()
+            except Empty:
+                break
+            self._snapshots[name] = snapshot
+
+    def export(self, force: bool = False):
+        self.collect()
+        if not force and monotonic() - self._lastexport < self._interval:
+            return
+        content = self._prometheus() if self._filename.endswith('.prom') else json.dumps(self.summary(), indent=2)
+        with open(f"{self._filename}.tmp", 'w') as f:
+            f.write(content)
+        os.replace(f"{self._filename}.tmp", self._filename)
+        self._lastexport = monotonic()
+
+    def summary(self) -> dict:
+        """
+        :return: processes and their totals per role, the gauges are averaged, the seconds of a stage are also given
+        as a share of all seconds recorded by the role
+        """
+        roles = {}
+        for name, snapshot in sorted(self._snapshots.items()):
+            role = roles.setdefault(name.split('-', 1)[0], {'processes': 0, 'seconds': defaultdict(float),
+                                                             'rows': defaultdict(int), 'counters': defaultdict(float),
+                                                             'gauges': defaultdict(float)})
+            role['processes'] += 1
+            for kind in ['seconds', 'rows', 'counters', 'gauges']:
+                for key, value in snapshot[kind].items():
+                    role[kind][key] += value
+        for role in roles.values():
+            role['gauges'] = {key: value / role['processes'] for key, value in role['gauges'].items()}
+            total = sum(role['seconds'].values())
+            role['shares'] = {key: value / total for key, value in role['seconds'].items()} if total else {}
+
+        return {'time': time(), 'elapsed': time() - self._started, 'roles': roles, 'processes': self._snapshots}
+
+    def _prometheus(self) -> str:
+        samples = defaultdict(list)
+        for name, snapshot in sorted(self._snapshots.items()):
+            for stage, seconds in snapshot['seconds'].items():
+                samples[('stage_seconds_total', 'counter')].append((f'process="{name}",stage="{stage}"', seconds))
+            for stage, rows in snapshot['rows'].items():
+                samples[('stage_rows_total', 'counter')].append((f'process="{name}",stage="{stage}"', rows))
+            for key, value in snapshot['counters'].items():
+                samples[(f"{key}_total", 'counter')].append((f'process="{name}"', value))
+            for key, value in snapshot['gauges'].items():
+                samples[(key, 'gauge')].append((f'process="{name}"', value))
+
+        lines = []
+        for (metric, kind), values in samples.items():
+            lines.append(f"# TYPE {NAMESPACE}_{metric} {kind}")
+            lines += [f"{NAMESPACE}_{metric}{{{labels}}} {value}" for labels, value in values]
+        return "\n".join(lines) + "\n"
@@ -1,12 +1,18 @@
+import os
+from itertools import islice
 import numpy as np
 import pandas as pd
 import logging
+from cachetools import LRUCache
+from . import journal
 
 
 class MyDict(object):
     def __init__(self):
         self._dict = dict()
         self._counter = 0
+        # entries in the journal, the ones after these (in insertion order) are appended on save
+        self._saved = 0
 
     def map(self, key):
         if key is None:
@@ -19,14 +25,99 @@ class MyDict(object):
             self._counter += 1
             return self._counter - 1
 
+    def map_many(self, keys) -> list:
+        # bulk variant of map(), one round trip for a whole list of (distinct) keys, ids are assigned in key order
+        return [self.map(key) for key in keys]
+
     def save(self, filename: str):
-        pd.DataFrame.from_dict(data=self._dict, orient='index', dtype=object).to_csv(filename, header=False, na_rep='-')
+        """
+        :param filename: journal (see journal.py), only the new entries are appended, or csv, rewritten
+        """
+        if journal.isjournal(filename):
+            new = list(islice(self._dict.items(), self._saved, None))
+            journal.append(filename, [str(key).encode('utf-8') for key, _ in new], [int(id) for _, id in new])
+            self._saved += len(new)
+        else:
+            # replaced at once, a crash leaves the previous file
+            pd.DataFrame.from_dict(data=self._dict, orient='index', dtype=object).to_csv(f"{filename}.tmp",
+                                                                                        header=False, na_rep='-')
+            os.replace(f"{filename}.tmp", filename)
 
     def load(self, filename: str):
         try:
-            self._dict = pd.read_csv(filename, header=None, na_values='-').astype(str).set_index(0).to_dict()[1]
+            if journal.isjournal(filename):
+                self._dict = {}
+                for keys, ids in journal.read(filename):
+                    self._dict.update(zip([key.decode('utf-8') for key in keys], map(str, ids.tolist())))
+                self._saved = len(self._dict)
+            else:
+                self._dict = pd.read_csv(filename, header=None, na_values='-').astype(str).set_index(0).to_dict()[1]
             self._counter = len(self._dict)
         except FileNotFoundError:
             logging.warning(f"Secret file {filename} not found, using empty dict.")
         except pd.errors.EmptyDataError:
             logging.warning(f"Secret file {filename} is empty, using empty dict.")
+
+
+class CachedDict(object):
+    """
+    Process-local LRU cache of the ids in front of a mapper, only the misses go to the mapper, in one map_many call.
+    Ids never change once assigned, nothing to invalidate.
+    """
+
+    def __init__(self, mydict, cachesize: int):
+        """
+        :param mydict: mapper instance or proxy
+        :param cachesize: number of ids kept, 0 disables the cache
+        """
+        assert cachesize >= 0, f"invalid cachesize: '{cachesize}'"
+        self._mydict = mydict
+        self._cache = LRUCache(maxsize=cachesize)
+
+        self.hits = 0
+        self.misses = 0
+        # map_many calls to the mapper (round trips to the manager)
+        self.calls = 0
+
+    def map(self, key):
+        return self.map_many([key])[0]
+
+    def map_many(self, keys) -> list:
+        ids = {}
+        missing = []
+        for key in keys:
+            if key in self._cache:
+                ids[key] = self._cache[key]
+            else:
+                missing.append(key)
+        self.hits += len(ids)
+        self.misses += len(missing)
+
+        if missing:
+            self.calls += 1
+            found = dict(zip(missing, self._mydict.map_many(missing)))
+            if self._cache.maxsize > 0:
+                self._cache.update(found)
+            ids.update(found)
+
+        return [ids[key] for key in keys]
+
+    @property
+    def hitrate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0
+
+
+def substitute(column: pd.Series, mydict) -> pd.Series:
+    """
+    Map a column through mydict, sending only the distinct values (in order of first appearance).
+
+    :param column: values to map, NaN values are kept
+    :param mydict: MyDict instance or proxy
+    """
+    codes, uniques = pd.factorize(column)
+    if len(uniques) == 0:
+        return column
+
+    # code -1 (NaN) picks the trailing NaN
+    ids = np.array(mydict.map_many(list(uniques)) + [np.nan], dtype=object)
+    return pd.Series(ids[codes], index=column.index, name=column.name)
@@ -0,0 +1,148 @@
+from multiprocessing import Pool
+from collections import deque
+import bz2
+import io
+import os
+
+# stream header 'BZh' + block size level, followed by the magic of the first block (BCD pi)
+_HEADER = b"BZh"
+_LEVELS = b"123456789"
+_BLOCKMAGIC = b"\x31\x41\x59\x26\x53\x59"
+
+
+def streams(filename: str, blocksize: int = 16 << 20, limit: int = None):
+    """
+    Find the byte offsets of the bz2 streams in a (multi-stream) file, e.g. pbzip2 output.
+
+    :param limit: stop reading once past this many bytes, None reads the whole file
+    """
+    with open(filename, 'rb') as f:
+        pos = 0
+        tail = b""
+        while limit is None or pos <= limit:
+            data = f.read(blocksize)
+            if not data:
+                break
+
+            buff = tail + data
+            base = pos - len(tail)
+            i = buff.find(_HEADER)
+            while i != -1 and i + 10 <= len(buff):
+                if buff[i + 3] in _LEVELS and buff[i + 4:i + 10] == _BLOCKMAGIC:
+                    yield base + i
+                i = buff.find(_HEADER, i + 1)
+
+            # a header may span over the read border, headers starting here were not checked yet
+            tail = buff[-9:]
+            pos += len(data)
+
+
+def _decompress(filename: str, start: int, end: int) -> bytes:
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        return bz2.decompress(f.read(end - start))
+
+
+class ParallelBZ2Reader(io.RawIOBase):
+    """
+    Decompress a multi-stream bz2 file with a pool of processes. Consecutive streams are grouped into pieces of
+    ~piecesize compressed bytes, the pieces are decompressed in parallel and read back in order. The pieces in flight
+    hold about readahead decompressed bytes, estimated by the compression ratio of the pieces read so far.
+    """
+
+    def __init__(self, filename: str, processes: int, piecesize: int = 8 << 20, readahead: int = 512 << 20):
+        """
+        :param filename: bz2 file to read
+        :param processes: number of decompressor processes
+        :param piecesize: compressed bytes decompressed by one task
+        :param readahead: decompressed bytes of the pieces in flight and the one being read, one piece is always in
+        flight (the only one until the first is back and the ratio known)
+        """
+        super().__init__()
+        assert processes > 0, f"invalid processes: '{processes}'"
+        assert piecesize > 0, f"invalid piecesize: '{piecesize}'"
+        assert readahead > 0, f"invalid readahead: '{readahead}'"
+        self._filename = filename
+        self._processes = processes
+        self._piecesize = piecesize
+        self._readahead = readahead
+
+        # compressed and decompressed bytes of the pieces read, the compression ratio
+        self._compressed = 0
+        self._decompressed = 0
+
+        self._pool = Pool(processes)
+        self._pieces = self._split()
+        self._next = next(self._pieces, None)
+        self._pending = deque()
+        self._buffer = memoryview(b"")
+        self._position = 0
+        self._submit()
+
+    @staticmethod
+    def is_multistream(filename: str, probe: int = 64 << 20) -> bool:
+        """
+        Check for a second stream within the first probe bytes.
+        """
+        for start in streams(filename, limit=probe):
+            if start > probe:
+                return False
+            if start > 0:
+                return True
+        return False
+
+    def _split(self):
+        size = os.path.getsize(self._filename)
+        piecestart = 0
+        for start in streams(self._filename):
+            if start - piecestart >= self._piecesize:
+                yield piecestart, start
+                piecestart = start
+        if piecestart < size:
+            yield piecestart, size
+
+    def _submit(self):
+        # keep the pool busy, but do not read ahead too much
+        while self._next is not None and len(self._pending) < 2 * self._processes:
+            start, end = self._next
+            if self._pending:
+                if not self._compressed:
+                    break
+                inflight = sum(pending[1] - pending[0] for pending in self._pending) + end - start
+                if inflight * self._decompressed / self._compressed + len(self._buffer) > self._readahead:
+                    break
+            self._pending.append((start, end, self._pool.apply_async(_decompress, (self._filename, start, end))))
+            self._next = next(self._pieces, None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            if not self._pending:
+                # EOF
+                return 0
+            start, end, result = self._pending.popleft()
+            self._buffer = memoryview(result.get())
+            self._position = end
+            self._compressed += end - start
+            self._decompressed += len(self._buffer)
+            self._submit()
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._pool.terminate()
+            self._pool.join()
+        super().close()
+
+    @property
+    def position(self) -> int:
+        """
+        :return: compressed bytes consumed
+        """
+        return self._position
@@ -0,0 +1,100 @@
+from fnmatch import fnmatch
+import re
+import numpy as np
+import pandas as pd
+
+# any line: method, host and status after the first quoted field (the request), the last field (side)
+_LINE = re.compile(rb'^((?:[^"\n]*"(?P<method>[^ "\n]*) (?:[a-zA-Z][a-zA-Z0-9+.-]*://(?P<host>[^/?#\\ "\n]*))?'
+                   rb'[^"\n]*" (?P<status>[^ \n]*))?(?:[^\n]* )?(?P<side>[^ \r\n]*)\r?)$', re.MULTILINE)
+
+# rules in the order applied, a line dropped is counted for the first rule rejecting it
+RULES = ['side', 'method', 'status', 'host']
+
+
+class Prefilter(object):
+    """
+    Drops the lines of a batch before parsing, by cheap checks on the raw bytes: the side marker (non downstream lines
+    of equuleus_v2), the request method, the status code range, and host allow and deny lists (e.g. probes with a
+    script in the host). Lines with no host in the request are not checked against the host lists. The checks run
+    once per distinct value of a batch.
+    """
+
+    def __init__(self, side: bool = False, methods: list = None, statuses: tuple = None, allowhosts: list = None,
+                 denyhosts: list = None):
+        """
+        :param side: keep the lines ending with the c (client side) marker only
+        :param methods: methods kept, e.g. ['GET', 'HEAD']
+        :param statuses: (lowest, highest) status code kept
+        :param allowhosts: fnmatch patterns of the hosts kept, e.g. ['*.cdn.de']
+        :param denyhosts: fnmatch patterns of the hosts dropped, over the allowed ones
+        """
+        assert statuses is None or statuses[0] <= statuses[1], f"invalid statuses: '{statuses}'"
+        self._methods = {method.encode('ascii') for method in methods} if methods else None
+        self._statuses = statuses
+        self._allowhosts = [pattern.lower() for pattern in allowhosts] if allowhosts else None
+        self._denyhosts = [pattern.lower() for pattern in denyhosts] if denyhosts else None
+        active = [side, self._methods is not None, statuses is not None,
+                  self._allowhosts is not None or self._denyhosts is not None]
+        self._rules = [rule for rule, on in zip(RULES, active) if on]
+
+        # lines dropped so far per rule
+        self.dropped = dict.fromkeys(self._rules, 0)
+
+    def __bool__(self):
+        return len(self._rules) > 0
+
+    def _passes(self, rule: str, value: bytes) -> bool:
+        if rule == 'side':
+            return value == b'c'
+        if rule == 'method':
+            return value in self._methods
+        if rule == 'status':
+            return value.isdigit() and self._statuses[0] <= int(value) <= self._statuses[1]
+
+        if value == b'':
+            return True
+        host = value.decode('latin-1').lower()
+        if self._denyhosts and any(fnmatch(host, pattern) for pattern in self._denyhosts):
+            return False
+        return not self._allowhosts or any(fnmatch(host, pattern) for pattern in self._allowhosts)
+
+    def filter(self, batch) -> tuple:
+        """
+        :param batch: bytes-like, lines of the logfile
+        :return: (lines kept, the batch itself if none dropped, lines dropped per rule)
+        """
+        if self._rules == ['side']:
+            return self._filter_side(batch)
+
+        matches = _LINE.findall(batch)
+        groups = dict(zip(['line', 'method', 'host', 'status', 'side'],
+                          [np.array(group, dtype=object) for group in zip(*matches)] if matches else
+                          [np.array([], dtype=object)] * 5))
+
+        # empty lines are left out as well, not counted
+        keep = groups['line'] != b''
+        dropped = {}
+        for rule in self._rules:
+            codes, uniques = pd.factorize(groups[rule])
+            passed = np.array([self._passes(rule, value) for value in uniques], dtype=bool)[codes]
+            dropped[rule] = int(np.count_nonzero(keep & ~passed))
+            keep &= passed
+            self.dropped[rule] += dropped[rule]
+
+        if not any(dropped.values()):
+            return batch, dropped
+        return b"\n".join(groups['line'][keep]) + b"\n" if keep.any() else b"", dropped
+
+    def _filter_side(self, batch) -> tuple:
+        # the side rule alone needs no regex, a suffix check per line is several times faster
+        lines = bytes(batch).split(b"\n")
+        kept = [line for line in lines if line.endswith((b" c", b" c\r"))]
+        dropped = {'side': len(lines) - lines.count(b"") - len(kept)}
+        self.dropped['side'] += dropped['side']
+
+        if not dropped['side']:
+            return batch, dropped
+        return b"\n".join(kept) + b"\n" if kept else b"", dropped
+
+    def stats(self) -> str:
+        return ", ".join(f"{count} by {rule}" for rule, count in self.dropped.items())
@@ -0,0 +1,112 @@
+from collections import defaultdict
+from multiprocessing import util
+import cProfile
+import glob
+import os
+import pstats
+import sys
+import threading
+
+# per process profiles in the profile directory, merged per role by merge()
+EXTENSION = '.prof'
+
+# from 3.12 on cProfile takes the interpreter wide sys.monitoring, a second profile can not be enabled
+THREADS = sys.version_info < (3, 12)
+
+
+class Profiler(object):
+    """
+    cProfile of a process, its main thread and the threads started later (each thread has a profile of its own, they
+    are added up), written to directory/<role>-<pid>.prof when the process exits. With count > 0 the main thread is
+    profiled for the batches skip to skip + count only (see begin() and end()), the threads for their whole run. The
+    threads are profiled up to Python 3.11 only (see THREADS).
+    """
+
+    def __init__(self, directory: str, role: str, skip: int = 0, count: int = 0):
+        """
+        :param directory: None disables the profiler
+        :param role: Reader, Worker, Manager... the profiles of a role are merged
+        """
+        assert skip >= 0, f"invalid skip: '{skip}'"
+        assert count >= 0, f"invalid count: '{count}'"
+        self._directory = directory
+        self._role = role
+        self._skip = skip
+        self._count = count
+        self._batches = 0
+        self._active = False
+        # created in the process profiled, the first one of the main thread
+        self._profiles = []
+
+    def start(self):
+        if self._directory is None:
+            return
+        self._profiles.append(cProfile.Profile())
+        if THREADS:
+            threading.setprofile(self._thread)
+        if self._count == 0:
+            self._profiles[0].enable()
+
+        # the processes exit through multiprocessing, the atexit handlers are not run there
+        util.Finalize(None, self.stop, exitpriority=100)
+
+    def _thread(self, frame, event, arg):
+        # first event of a new thread, the profile replaces this hook
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        profile.enable()
+
+    def begin(self):
+        """
+        A batch starts.
+        """
+        if self._profiles and self._count > 0 and self._skip <= self._batches < self._skip + self._count:
+            self._profiles[0].enable()
+            self._active = True
+        self._batches += 1
+
+    def end(self):
+        if self._active:
+            self._profiles[0].disable()
+            self._active = False
+
+    def stop(self):
+        if self._directory is None:
+            return
+        if THREADS:
+            threading.setprofile(None)
+        self._profiles[0].disable()
+
+        profiles = []
+        for profile in self._profiles:
+            profile.create_stats()
+            if profile.stats:
+                profiles.append(profile)
+        if profiles:
+            pstats.Stats(*profiles).dump_stats(os.path.join(self._directory, f"{self._role}-{os.getpid()}{EXTENSION}"))
+        self._directory = None
+
+
+def start(directory: str, role: str):
+    """
+    Profile the calling process until it exits, e.g. as the initializer of a manager.
+    """
+    Profiler(directory, role).start()
+
+
+def merge(directory: str) -> list:
+    """
+    Merge the profiles of the processes per role into directory/<role>.pstats, the process profiles are removed.
+
+    :return: filenames written
+    """
+    roles = defaultdict(list)
+    for filename in sorted(glob.glob(os.path.join(directory, f"*{EXTENSION}"))):
+        roles[os.path.basename(filename).rsplit('-', 1)[0]].append(filename)
+
+    merged = []
+    for role, filenames in roles.items():
+        merged.append(os.path.join(directory, f"{role}.pstats"))
+        pstats.Stats(*filenames).dump_stats(merged[-1])
+        list(map(os.remove, filenames))
+    return merged
@@ -2,76 +2,192 @@ from multiprocessing import Process, Queue
 from queue import Full
 from tqdm.auto import tqdm
 import bz2
+import io
 import os
 from itertools import islice
 import logging
 import platform
+from time import perf_counter
+from .pbz2 import ParallelBZ2Reader
+from .ringbuffer import RingBuffer
+from .batch import Batch, FileProgress
+from .metrics import Metrics
+from .profiling import Profiler
 
 
 class Reader(Process):
-    def __init__(self, filename: str, batchsize: int, maxlines: int, queuelen: int):
+    def __init__(self, filename: str, batchsize: int, maxlines: int, queuelen: int, decoders: int = 1,
+                 slotsize: int = 0, batchbytes: int = 0, skip: int = 0, queue=None, fileno: int = 0,
+                 progress: FileProgress = None, metrics: Queue = None, metricsinterval: float = 10,
+                 profile: str = None, decodeahead: int = 512 << 20):
+        """
+        :param decodeahead: decompressed bytes read ahead by the decoders (see pbz2.ParallelBZ2Reader)
+        :param queue: Queue or RingBuffer shared with the readers of other logfiles, created with queuelen and slotsize
+        if None
+        :param fileno: number of the logfile, sent with the batches
+        :param progress: number of batches sent is reported here at the end
+        :param metrics: queue of the timings to the main process (see metrics.Exporter), sent every metricsinterval
+        seconds
+        :param profile: directory of the profile of the run (see profiling.Profiler)
+        """
         super().__init__(name=f"Reader-{filename}")
         self._filename = filename
         self._batchsize = batchsize
         self._maxlines = maxlines
 
-        self._queue = Queue(maxsize=queuelen)
+        # batches of batchbytes decompressed bytes instead of batchsize lines
+        assert batchbytes >= 0, f"invalid batchbytes: '{batchbytes}'"
+        self._batchbytes = batchbytes
+
+        # batches done before a checkpoint, cut the same way but not sent
+        assert skip >= 0, f"invalid skip: '{skip}'"
+        self._skip = skip
+
+        assert decoders > 0, f"invalid decoders: '{decoders}'"
+        self._decoders = decoders
+        self._decodeahead = decodeahead
+
+        # shared memory ring of queuelen slots, or batches pickled through the queue
+        assert slotsize >= 0, f"invalid slotsize: '{slotsize}'"
+        if queue is None:
+            queue = RingBuffer(queuelen, slotsize) if slotsize > 0 else Queue(maxsize=queuelen)
+        self._queue = queue
+        self._fileno = fileno
+        self._progress = progress
+        self._metrics = metrics
+        self._metricsinterval = metricsinterval
+        self._profiler = Profiler(profile, 'Reader')
         self._logger = logging.getLogger(self.name)
 
+    def _open(self, logfile):
+        # parallel decompression needs multiple streams to split on
+        if self._decoders > 1:
+            if ParallelBZ2Reader.is_multistream(self._filename):
+                decoder = ParallelBZ2Reader(self._filename, self._decoders, readahead=self._decodeahead)
+                return io.BufferedReader(decoder, buffer_size=1 << 20)
+            self._logger.warning(f"{self._filename} is not a multi-stream bz2 file (e.g. pbzip2 output), "
+                                 f"falling back to sequential decompression")
+        return bz2.BZ2File(logfile)
+
     def run(self):
+        self._profiler.start()
+        sent = 0
+        # the time blocked on a full queue tells slow workers
+        metrics = Metrics(self.name, self._metrics, self._metricsinterval)
         try:
             # open logfile for reading
             # attach decompressor
-            # create progress bars
+            # create progress bars, three lines per logfile, the readers of several logfiles run at once
+            position = 3 * self._fileno
             with open(self._filename, 'rb') as logfile, \
-                    bz2.BZ2File(logfile) as logreader, \
-                    tqdm(total=os.path.getsize(self._filename), position=0, desc=self._filename, unit='B',
+                    self._open(logfile) as logreader, \
+                    tqdm(total=os.path.getsize(self._filename), position=position, desc=self._filename, unit='B',
                          unit_scale=True) as pbar_filepos, \
-                    tqdm(position=1, unit='line', desc=self._filename, unit_scale=True) as pbar_lines, \
-                    tqdm(position=2) as pbar_queue:
+                    tqdm(position=position + 1, unit='line', desc=self._filename, unit_scale=True) as pbar_lines, \
+                    tqdm(position=position + 2) as pbar_queue:
 
                 # for progress bar
                 lastpos = 0
+                if isinstance(logreader, io.BufferedReader):
+                    filepos = lambda: logreader.raw.position
+                else:
+                    filepos = logfile.tell
+
+                # decompression and cutting, the time between the batches sent
+                last = perf_counter()
+                for seq, (batch, lines) in enumerate(self._batches(logreader)):
+                    metrics.record('read', perf_counter() - last, lines)
 
-                # slice lines in batches from logreader
-                maxitems = self._maxlines
-                it = iter(logreader)
-                batch = b"".join(islice(it, self._batchsize))
-                while batch:
                     # update progress bar
-                    if logfile.tell() > lastpos:
-                        pbar_filepos.update(logfile.tell() - lastpos)
-                        lastpos = logfile.tell()
-                    pbar_lines.update(self._batchsize)
+                    if filepos() > lastpos:
+                        pbar_filepos.update(filepos() - lastpos)
+                        lastpos = filepos()
+                    pbar_lines.update(lines)
                     if platform.system() != 'Darwin':
-                        pbar_queue.display(f"read queue: {self._queue.qsize()}")
+                        queued = self._queue.qsize()
+                        pbar_queue.display(f"read queue: {queued}")
+                        metrics.set('queue_depth', queued)
+                    metrics.add('lines', lines)
+
+                    if seq < self._skip:
+                        continue
 
                     # send them for the workers, this may block for backpressure
+                    start = perf_counter()
                     while True:
                         try:
-                            self._queue.put(batch, block=True, timeout=0.1)
+                            self._queue.put(Batch(seq, batch, self._fileno), block=True, timeout=0.1)
                         except Full:
                             continue
                         else:
+                            sent += 1
                             break
-
-                    # check limit (-1 means, no limit)
-                    if maxitems != -1:
-                        maxitems = max(0, maxitems - self._batchsize)
-                        if maxitems == 0:
-                            # reached maxitems
-                            break
-
-                    # get the next one
-                    batch = b"".join(islice(it, self._batchsize))
+                    metrics.record('put', perf_counter() - start, lines)
+                    metrics.add('batches')
+                    metrics.send()
+                    last = perf_counter()
 
         except KeyboardInterrupt:
             self._logger.info("Interrupt")
         except Exception:
             self._logger.exception("Error")
         finally:
+            if self._progress is not None:
+                self._progress.read(self._fileno, sent)
+            metrics.send(force=True)
             self._queue.close()
 
+    def _batches(self, logreader):
+        """
+        Cut the decompressed input in batches, stop after maxlines lines.
+
+        :return: generator of (batch, number of lines)
+        """
+        maxitems = self._maxlines
+        if self._batchbytes > 0:
+            # read large blocks, cut at the last newline, carry the remainder over to the next block
+            remainder = b""
+            while maxitems != 0:
+                block = logreader.read(self._batchbytes)
+                if not block:
+                    # last line may miss the newline
+                    batch, remainder = remainder, b""
+                else:
+                    cut = block.rfind(b"\n") + 1
+                    if cut == 0:
+                        # line longer than a block
+                        remainder += block
+                        continue
+                    batch, remainder = remainder + block[:cut], block[cut:]
+                if not batch:
+                    break
+
+                lines = batch.count(b"\n") + (not batch.endswith(b"\n"))
+
+                # check limit (-1 means, no limit)
+                if maxitems != -1:
+                    if lines > maxitems:
+                        end = 0
+                        for _ in range(maxitems):
+                            end = batch.index(b"\n", end) + 1
+                        batch, lines = batch[:end], maxitems
+                    maxitems -= lines
+
+                yield batch, lines
+        else:
+            # slice lines in batches from logreader
+            it = iter(logreader)
+            while maxitems != 0:
+                batch = list(islice(it, self._batchsize if maxitems == -1 else min(maxitems, self._batchsize)))
+                if not batch:
+                    break
+
+                # check limit (-1 means, no limit)
+                if maxitems != -1:
+                    maxitems -= len(batch)
+
+                yield b"".join(batch), len(batch)
+
     @property
     def queue(self):
         return self._queue
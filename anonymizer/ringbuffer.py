@@ -0,0 +1,98 @@
+from multiprocessing import Queue
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty, Full
+import io
+from .batch import Batch
+
+
+class RingBuffer(object):
+    """
+    Batch transport over a ring of fixed size slots in shared memory. Only the slot index, the batch length and the
+    other fields of the batch travel over the queue, free slots are handed back by the consumer. The number of slots limits the
+    read-ahead. Any number of producers can share it.
+    """
+
+    def __init__(self, slots: int, slotsize: int):
+        """
+        :param slots: number of slots (ring depth)
+        :param slotsize: size of a slot in bytes, larger batches are sent over the queue
+        """
+        assert slots > 0, f"invalid slots: '{slots}'"
+        assert slotsize > 0, f"invalid slotsize: '{slotsize}'"
+        self._slots = slots
+        self._slotsize = slotsize
+        self._shm = SharedMemory(create=True, size=slots * slotsize)
+
+        self._queue = Queue(maxsize=slots)
+        self._free = Queue(maxsize=slots)
+        for slot in range(slots):
+            self._free.put(slot)
+
+    def __getstate__(self):
+        return self._shm.name, self._queue, self._free, self._slots, self._slotsize
+
+    def __setstate__(self, state):
+        name, self._queue, self._free, self._slots, self._slotsize = state
+        self._shm = SharedMemory(name=name)
+
+    def put(self, batch: Batch, block: bool = True, timeout: float = None):
+        seq, data, fileno, created = batch
+        if len(data) > self._slotsize:
+            # does not fit, send it through the pipe
+            self._queue.put((None, data, seq, fileno, created), block=block, timeout=timeout)
+            return
+
+        try:
+            slot = self._free.get(block=block, timeout=timeout)
+        except Empty:
+            raise Full
+
+        offset = slot * self._slotsize
+        self._shm.buf[offset:offset + len(data)] = data
+        self._queue.put((slot, len(data), seq, fileno, created))
+
+    def get(self, block: bool = True, timeout: float = None):
+        """
+        :return: (slot, Batch with a memoryview), hand the view back with release() once parsed
+        """
+        slot, data, seq, fileno, created = self._queue.get(block=block, timeout=timeout)
+        if slot is None:
+            return None, Batch(seq, memoryview(data), fileno, created)
+
+        offset = slot * self._slotsize
+        return slot, Batch(seq, self._shm.buf[offset:offset + data], fileno, created)
+
+    def release(self, slot, view: memoryview):
+        view.release()
+        if slot is not None:
+            self._free.put(slot)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def close(self):
+        self._queue.close()
+
+    def unlink(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+class MemoryviewReader(io.RawIOBase):
+    """
+    Binary file object over a memoryview, lets the parser read the batch without copying it as a whole.
+    """
+
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
@@ -0,0 +1,149 @@
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+from .hashtable import HashTable
+
+
+class SharedDict(HashTable):
+    """
+    Key to id mapping in a shared memory hash table (see HashTable), read by every process directly. When full, the
+    table is copied to a larger segment of the next generation under the insert lock, a small root segment names the
+    current one. The other processes move to it on their next insert, their lookups read the previous segment until
+    then, it stays mapped.
+
+    Layout of the segment: table | arena. Layout of the root: generation, capacity, maximum entries, arena bytes.
+    """
+
+    # growth factor of the entries and the arena
+    _GROWTH = 1.5
+
+    def __init__(self, capacity: int, arenasize: int):
+        """
+        :param capacity: initial number of index slots, at most 75% of it can be used
+        :param arenasize: initial bytes reserved for the keys
+        """
+        assert arenasize > 0, f"invalid arenasize: '{arenasize}'"
+        super().__init__(capacity)
+        self._arenasize = arenasize
+        self._generation = 0
+        self._root = SharedMemory(create=True, size=8 * 4)
+        self._rootview = self._root.buf.cast('q')
+        self._shm = SharedMemory(name=self._segment(0), create=True, size=self._tablebytes() + arenasize)
+        self._lock = Lock()
+        self._attach()
+        self._publish()
+
+    def _segment(self, generation: int) -> str:
+        return f"{self._root.name}_{generation}"
+
+    def _attach(self):
+        tablebytes = self._tablebytes()
+        self._carve(self._shm.buf[:tablebytes], self._shm.buf[tablebytes:tablebytes + self._arenasize])
+
+    def _publish(self):
+        # the generation last, the sizes are in place when it is seen
+        self._rootview[1] = self._capacity
+        self._rootview[2] = self._maxentries
+        self._rootview[3] = self._arenasize
+        self._rootview[0] = self._generation
+
+    def _open(self):
+        """
+        Attach the segment named by the root, called with the lock held.
+        """
+        self._generation, self._capacity, self._maxentries, self._arenasize = self._rootview.tolist()
+        self._shm = SharedMemory(name=self._segment(self._generation))
+        self._attach()
+
+    def _follow(self):
+        """
+        Move to the current segment if another process has grown the table, called with the lock held.
+        """
+        if self._rootview[0] != self._generation:
+            self._release()
+            self._shm.close()
+            self._open()
+
+    def _insert(self, data: bytes, h: int, id: int = None) -> int:
+        self._follow()
+        return super()._insert(data, h, id)
+
+    def _grow(self, entries: int, used: int):
+        # the new segment is filled before it is published, the previous one is unlinked, the processes not moved
+        # yet keep it mapped
+        arenasize = self._arenasize
+        while used > arenasize:
+            arenasize = int(arenasize * self._GROWTH) + 1
+
+        count, oldused = self._header[0], self._header[1]
+        old = self._views()
+        oldcapacity = self._capacity
+        if entries > self._maxentries:
+            self._maxentries = int(self._maxentries * self._GROWTH) + 1
+            while self._maxentries > self._capacity * self._MAXLOAD:
+                self._capacity *= 2
+
+        tablebytes = self._tablebytes()
+        shm = SharedMemory(name=self._segment(self._generation + 1), create=True, size=tablebytes + arenasize)
+        new = self._split(shm.buf[:tablebytes])
+        new[0][:] = old[0]
+        for view, oldview in zip(new[1:5], old[1:5]):
+            view[:count] = oldview[:count]
+        if self._capacity == oldcapacity:
+            new[5][:] = old[5]
+        else:
+            self._reindex(new[5], new[1], count)
+        shm.buf[tablebytes:tablebytes + oldused] = old[6][:oldused]
+        for view in new:
+            view.release()
+
+        self._release()
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = shm
+        self._arenasize = arenasize
+        self._generation += 1
+        self._attach()
+        self._publish()
+
+    def _items(self, since: int = 0) -> list:
+        with self._lock:
+            self._follow()
+        return super()._items(since)
+
+    def __len__(self):
+        with self._lock:
+            self._follow()
+        return super().__len__()
+
+    def __getstate__(self):
+        # the sizes are in the root
+        return self._root.name, self._lock
+
+    def __setstate__(self, state):
+        name, self._lock = state
+        self._root = SharedMemory(name=name)
+        self._rootview = self._root.buf.cast('q')
+        with self._lock:
+            self._open()
+
+    def close(self):
+        self._release()
+        self._rootview.release()
+        self._shm.close()
+        self._root.close()
+
+    def _release(self):
+        # views have to go before the segment can be closed
+        for view in self._views() + [self._buffer]:
+            view.release()
+
+    def __del__(self):
+        if hasattr(self, '_arena'):
+            self._release()
+
+    def unlink(self):
+        with self._lock:
+            self._follow()
+        self.close()
+        self._shm.unlink()
+        self._root.unlink()
@@ -0,0 +1,311 @@
+from io import StringIO
+import os
+import pandas as pd
+from .compression import CODECS, BackgroundWriter, open_decompressed
+from .metrics import Metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class Sink(object):
+    """
+    Output file of a worker, written batch by batch. The batches arrive with the index set (see Worker). The seq and
+    the number of rows of each batch are listed in the index file next to it, the merge restores the original order
+    from these (see merge.py).
+    """
+
+    # appended to the output filename
+    EXTENSION = ''
+
+    # the output can be continued after a checkpoint
+    RESUMABLE = False
+
+    def __init__(self, filename: str, mapped: list, numericids: bool, compression: str = 'bz2',
+                 compresslevel: int = None, append: bool = False, metrics: Metrics = None):
+        """
+        :param filename: output file
+        :param mapped: columns substituted by the mapper
+        :param numericids: mapped columns hold integer ids (manager and shm mappers), or strings (hash mapper)
+        :param compression: codec of the text sinks, see compression.CODECS
+        :param compresslevel: level of the codec, None for its default
+        :param append: continue the output of a previous run, truncated to a checkpoint (see checkpoint())
+        :param metrics: of the worker, for the work done on threads of the sink
+        """
+        assert compression in CODECS, f"invalid compression: '{compression}'"
+        assert not append or self.RESUMABLE, f"{type(self).__name__} can not be appended to"
+        self._filename = filename
+        self._mapped = mapped
+        self._numericids = numericids
+        self._compression = compression
+        self._compresslevel = compresslevel
+        self._metrics = metrics
+        self._index = open(self.indexname(filename), 'a' if append else 'w')
+
+    @classmethod
+    def extension(cls, compression: str) -> str:
+        return cls.EXTENSION
+
+    @staticmethod
+    def indexname(filename: str) -> str:
+        return f"{filename}.idx"
+
+    @staticmethod
+    def read_index(filename: str) -> list:
+        """
+        :return: (seq, rows) of the batches in filename, in the order written
+        """
+        with open(Sink.indexname(filename)) as index:
+            return [tuple(map(int, line.split(','))) for line in index]
+
+    @classmethod
+    def segments(cls, filename: str, compression: str):
+        """
+        :return: generator of (seq, batch as written), see concat()
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def concat(cls, filename: str, compression: str = 'bz2', compresslevel: int = None):
+        """
+        :return: writer of the batches read by segments(), with write(segment) and close()
+        """
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def write(self, chunk: pd.DataFrame, seq: int):
+        self._write(chunk)
+        self._index.write(f"{seq},{len(chunk)}\n")
+
+    def _write(self, chunk: pd.DataFrame):
+        raise NotImplementedError
+
+    def checkpoint(self) -> tuple:
+        """
+        Make everything written so far durable.
+
+        :return: (output size, index size), truncated to these the files can be appended to
+        """
+        raise NotImplementedError
+
+    def _sync_index(self) -> int:
+        self._index.flush()
+        os.fsync(self._index.fileno())
+        return self._index.tell()
+
+    def close(self):
+        self._index.close()
+
+
+class CsvSink(Sink):
+    """
+    Compressed csv, header repeated for every batch. Compression and writes run on a background thread.
+    """
+
+    EXTENSION = '.csv'
+    RESUMABLE = True
+
+    def __init__(self, filename: str, mapped: list, numericids: bool, compression: str = 'bz2',
+                 compresslevel: int = None, append: bool = False, metrics: Metrics = None):
+        super().__init__(filename, mapped, numericids, compression, compresslevel, append, metrics)
+        self._writer = BackgroundWriter(filename, compression, compresslevel, append, metrics)
+
+    @classmethod
+    def extension(cls, compression: str) -> str:
+        # uncompressed files are named .csv
+        return CODECS[compression][0] or cls.EXTENSION
+
+    @classmethod
+    def segments(cls, filename: str, compression: str):
+        """
+        :return: generator of (seq, (header line, row lines))
+        """
+        with open_decompressed(filename, compression) as f:
+            for seq, rows in cls.read_index(filename):
+                header = f.readline()
+                yield seq, (header, [f.readline() for _ in range(rows)])
+
+    @classmethod
+    def concat(cls, filename: str, compression: str = 'bz2', compresslevel: int = None):
+        return _CsvConcat(filename, compression, compresslevel)
+
+    def _write(self, chunk: pd.DataFrame):
+        buff = StringIO()
+        chunk.to_csv(buff, header=True)
+        self._writer.write(buff.getvalue().encode('utf-8'))
+
+    def checkpoint(self) -> tuple:
+        # the compressed stream is ended, the file is valid up to here
+        return self._writer.restart(), self._sync_index()
+
+    def close(self):
+        self._writer.close()
+        super().close()
+
+
+class _CsvConcat(object):
+    """
+    Writes the rows of csv segments, the header only once.
+    """
+
+    def __init__(self, filename: str, compression: str, compresslevel: int):
+        self._writer = BackgroundWriter(filename, compression, compresslevel)
+        self._header = None
+
+    def write(self, segment):
+        header, lines = segment
+        if self._header is None:
+            self._header = header
+            self._writer.write(header)
+        self._writer.write(b"".join(lines))
+
+    def close(self):
+        self._writer.close()
+
+
+class ArrowSink(Sink):
+    """
+    Arrow IPC stream, one record batch per batch. Mapped columns are int64 (or dictionary encoded for the hash mapper),
+    other strings dictionary encoded, timestamps native. The stream format, since every batch has its own dictionaries
+    (read with pyarrow.ipc.open_stream).
+    """
+
+    EXTENSION = '.arrows'
+
+    # types of the columns by role, the mapped columns are int64 (numeric ids), the rest is text (see _type())
+    TYPES = {'#timestamp': 'timestamp[ns]', 'utcoffset': 'int16', 'statuscode': 'int64', 'manifest': 'bool',
+             'fragment': 'bool', 'contentlength': 'double', 'timefirstbyte': 'double', 'timetoserv': 'double'}
+
+    def __init__(self, filename: str, mapped: list, numericids: bool, compression: str = 'bz2',
+                 compresslevel: int = None, append: bool = False, metrics: Metrics = None):
+        super().__init__(filename, mapped, numericids, compression, compresslevel, append, metrics)
+        assert pa is not None, f"{type(self).__name__} needs pyarrow"
+
+        # schema by the roles of the columns of the first batch, the values of a batch do not tell (all NaN)
+        self._schema = None
+        self._writer = None
+
+    def _type(self, name: str):
+        if name in self._mapped and self._numericids:
+            return pa.int64()
+        if name in self.TYPES:
+            return pa.type_for_alias(self.TYPES[name])
+        return pa.dictionary(pa.int32(), pa.string())
+
+    def _table(self, chunk: pd.DataFrame):
+        chunk = chunk.reset_index()
+        if self._schema is None:
+            self._schema = pa.schema([(name, self._type(name)) for name in chunk.columns])
+
+        arrays = []
+        for field in self._schema:
+            column = chunk[field.name]
+            if pa.types.is_dictionary(field.type):
+                # float when all NaN in a batch, or numbers only
+                if column.dtype != object:
+                    column = column.where(column.isna(), column.astype(str))
+                arrays.append(pa.Array.from_pandas(column, type=pa.string()).dictionary_encode())
+            elif pa.types.is_timestamp(field.type):
+                arrays.append(pa.Array.from_pandas(pd.to_datetime(column, errors='coerce'), type=field.type))
+            elif pa.types.is_integer(field.type):
+                arrays.append(pa.Array.from_pandas(pd.to_numeric(column, errors='coerce').astype('Int64'),
+                                                   type=field.type))
+            elif pa.types.is_floating(field.type):
+                arrays.append(pa.Array.from_pandas(pd.to_numeric(column, errors='coerce'), type=field.type))
+            else:
+                # NaN turns the bool columns to object
+                arrays.append(pa.Array.from_pandas(column, type=field.type))
+        return pa.Table.from_arrays(arrays, schema=self._schema)
+
+    @staticmethod
+    def _open(filename: str, schema):
+        return pa.ipc.new_stream(filename, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+    @classmethod
+    def segments(cls, filename: str, compression: str):
+        """
+        :return: generator of (seq, pyarrow.RecordBatch)
+        """
+        with pa.ipc.open_stream(filename) as reader:
+            yield from zip((seq for seq, _ in cls.read_index(filename)), reader)
+
+    @classmethod
+    def concat(cls, filename: str, compression: str = 'bz2', compresslevel: int = None):
+        return _ArrowConcat(filename, cls._open, cls._append)
+
+    @staticmethod
+    def _append(writer, table):
+        # one record batch per batch, empty ones too, the index counts them
+        writer.write_batch(pa.RecordBatch.from_arrays([column.combine_chunks() for column in table.columns],
+                                                      schema=table.schema))
+
+    def _write(self, chunk: pd.DataFrame):
+        table = self._table(chunk)
+        if self._writer is None:
+            self._writer = self._open(self._filename, self._schema)
+        self._append(self._writer, table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        super().close()
+
+
+class ParquetSink(ArrowSink):
+    """
+    Parquet file, one row group per batch, same column types as ArrowSink.
+    """
+
+    EXTENSION = '.parquet'
+
+    @staticmethod
+    def _open(filename: str, schema):
+        return pq.ParquetWriter(filename, schema, compression='zstd')
+
+    @staticmethod
+    def _append(writer, table):
+        # one row group per batch, empty ones too, the index counts them
+        writer.write_table(table, max(len(table), 1))
+
+    @classmethod
+    def segments(cls, filename: str, compression: str):
+        """
+        :return: generator of (seq, pyarrow.Table of the row group)
+        """
+        with pq.ParquetFile(filename) as reader:
+            for group, (seq, _) in enumerate(cls.read_index(filename)):
+                yield seq, reader.read_row_group(group)
+
+
+class _ArrowConcat(object):
+    """
+    Writes the record batches or tables of columnar segments, opens the file with the schema of the first one.
+    """
+
+    def __init__(self, filename: str, open, append):
+        self._filename = filename
+        self._open = open
+        self._append = append
+        self._writer = None
+
+    def write(self, segment):
+        if self._writer is None:
+            self._writer = self._open(self._filename, segment.schema)
+        self._append(self._writer, pa.Table.from_batches([segment]) if isinstance(segment, pa.RecordBatch) else segment)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+SINKS = {'csv': CsvSink}
+if pa is not None:
+    SINKS.update({'parquet': ParquetSink, 'arrow': ArrowSink})
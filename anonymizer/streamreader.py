@@ -0,0 +1,182 @@
+from multiprocessing import Process, Queue, Event
+from queue import Full
+from tqdm.auto import tqdm
+import logging
+import os
+import select
+import signal
+import stat
+import sys
+import time
+from .ringbuffer import RingBuffer
+from .batch import Batch
+from .metrics import Metrics
+from .profiling import Profiler
+
+
+class StreamReader(Process):
+    """
+    Reads plain text lines from stdin, a FIFO or a growing file (tail -F: reopened when rotated or truncated) and cuts
+    micro-batches of batchsize lines, or fewer once the first line of the batch waited maxdelay seconds. The batches
+    carry the time their first line was read, the workers report the latency from there.
+    """
+
+    # bytes read at once
+    _READSIZE = 1 << 16
+
+    # seconds between polls of a followed file at its end
+    _POLL = 0.1
+
+    def __init__(self, filename: str, batchsize: int, maxdelay: float, queuelen: int, slotsize: int = 0,
+                 follow: bool = False, queue=None, metrics: Queue = None, metricsinterval: float = 10,
+                 profile: str = None):
+        """
+        :param filename: '-' for stdin, a FIFO, or a regular file
+        :param maxdelay: seconds a line waits at most for its batch to fill
+        :param follow: wait for more lines at the end of a regular file, until stop()
+        :param queue: Queue or RingBuffer, created with queuelen and slotsize if None
+        :param metrics: queue of the timings to the main process (see metrics.Exporter)
+        :param profile: directory of the profile of the run (see profiling.Profiler)
+        """
+        super().__init__(name=f"StreamReader-{filename}")
+        assert batchsize > 0, f"invalid batchsize: '{batchsize}'"
+        assert maxdelay > 0, f"invalid maxdelay: '{maxdelay}'"
+        self._filename = filename
+        self._batchsize = batchsize
+        self._maxdelay = maxdelay
+        self._follow = follow
+        if queue is None:
+            queue = RingBuffer(queuelen, slotsize) if slotsize > 0 else Queue(maxsize=queuelen)
+        self._queue = queue
+        self._metrics = metrics
+        self._metricsinterval = metricsinterval
+        self._profiler = Profiler(profile, 'StreamReader')
+        self._stop = Event()
+        self._logger = logging.getLogger(self.name)
+
+        # stdin is closed in the child processes, it is read through a duplicate
+        self._stdin = os.dup(sys.stdin.fileno()) if filename == '-' else None
+
+    def stop(self):
+        """
+        Stop reading, the lines read so far are sent.
+        """
+        self._stop.set()
+
+    def _open(self) -> int:
+        if self._stdin is not None:
+            return self._stdin
+        # a FIFO blocks here until the writer opens it
+        return os.open(self._filename, os.O_RDONLY)
+
+    def _rotated(self, fd: int) -> bool:
+        """
+        :return: the followed file was replaced or truncated
+        """
+        try:
+            current = os.stat(self._filename)
+        except FileNotFoundError:
+            # between the rename and the new file
+            return False
+        opened = os.fstat(fd)
+        return current.st_ino != opened.st_ino or current.st_size < os.lseek(fd, 0, os.SEEK_CUR)
+
+    def _read(self, fd: int, timeout: float):
+        """
+        :return: bytes read, None if nothing arrived within timeout, b'' at the end of the stream
+        """
+        if not select.select([fd], [], [], timeout)[0]:
+            return None
+        data = os.read(fd, self._READSIZE)
+        if data or not (self._follow and stat.S_ISREG(os.fstat(fd).st_mode)):
+            return data
+
+        # end of a followed file, wait for it to grow
+        time.sleep(min(timeout, self._POLL))
+        return None
+
+    def run(self):
+        self._profiler.start()
+        # the main process stops the stream (see stop()), batches read are not lost to Ctrl-C
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        fd = None
+        metrics = Metrics(self.name, self._metrics, self._metricsinterval)
+        try:
+            fd = self._open()
+            with tqdm(position=0, unit='line', desc=self._filename, unit_scale=True) as pbar_lines:
+                seq = 0
+                buffer = bytearray()
+                lines = 0
+                # time the first line of the batch was read
+                first = None
+                end = False
+                while not end:
+                    if self._stop.is_set():
+                        end = True
+                    else:
+                        timeout = self._POLL if lines == 0 else max(0.0, first + self._maxdelay - time.time())
+                        data = self._read(fd, min(timeout, self._POLL))
+                        if data == b'':
+                            end = True
+                        elif data is not None:
+                            if first is None:
+                                first = time.time()
+                            buffer += data
+                            lines += data.count(b"\n")
+                        elif self._follow and self._rotated(fd):
+                            self._logger.info(f"{self._filename} rotated, reopening")
+                            os.close(fd)
+                            fd = self._open()
+
+                    # full batches, the rest of the complete lines once the first waited maxdelay, all at the end
+                    sent = False
+                    while buffer and (lines >= self._batchsize or end or
+                                      (lines > 0 and time.time() >= first + self._maxdelay)):
+                        count = min(lines, self._batchsize)
+                        cut = len(buffer) if end and count == lines else self._cut(buffer, count)
+                        batch = bytes(buffer[:cut])
+                        del buffer[:cut]
+                        self._put(Batch(seq, batch, 0, first), count, metrics)
+                        pbar_lines.update(count + (not batch.endswith(b"\n")))
+                        seq += 1
+                        lines -= count
+                        sent = True
+                    if sent:
+                        first = time.time() if buffer else None
+
+        except Exception:
+            self._logger.exception("Error")
+        finally:
+            if fd is not None:
+                os.close(fd)
+            metrics.send(force=True)
+            self._queue.close()
+
+    @staticmethod
+    def _cut(buffer: bytearray, lines: int) -> int:
+        """
+        :return: offset after the first lines lines
+        """
+        offset = 0
+        for _ in range(lines):
+            offset = buffer.index(b"\n", offset) + 1
+        return offset
+
+    def _put(self, batch: Batch, lines: int, metrics: Metrics):
+        # send it to the workers, this may block for backpressure
+        with metrics.stage('put', lines):
+            while True:
+                try:
+                    self._queue.put(batch, block=True, timeout=0.1)
+                except Full:
+                    continue
+                else:
+                    break
+        metrics.add('batches')
+        metrics.add('lines', lines)
+        metrics.send()
+
+    @property
+    def queue(self):
+        return self._queue
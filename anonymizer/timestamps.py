@@ -0,0 +1,43 @@
+import re
+import numpy as np
+import pandas as pd
+
+# +hhmm or -hhmm, the closing bracket of the common log format may follow
+_OFFSET = re.compile(r'([+-])(\d\d)(\d\d)\]?$')
+
+
+def parse(column: pd.Series, dateformat: str, days: int = 0) -> pd.Series:
+    """
+    Parse each distinct timestamp once, the lines of the same second share it, and shift them by days. Invalid
+    timestamps are NaT.
+
+    :param dateformat: strptime format, e.g. '[%d/%b/%Y:%H:%M:%S'
+    """
+    codes, uniques = pd.factorize(column)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format=dateformat, errors='coerce')
+    parsed += pd.Timedelta(days=days)
+
+    # missing values have code -1, the NaT at the end
+    values = np.append(parsed.values.astype('datetime64[ns]'), np.datetime64('NaT', 'ns'))
+    return pd.Series(values[codes], index=column.index, name=column.name)
+
+
+def utcoffset(column: pd.Series) -> pd.Series:
+    """
+    :return: minutes east of UTC of the +hhmm or -hhmm offsets, each distinct one converted once, <NA> if invalid
+    """
+    codes, uniques = pd.factorize(column)
+    offsets = [None if match is None else (-1 if match[1] == '-' else 1) * (int(match[2]) * 60 + int(match[3]))
+               for match in map(_OFFSET.match, map(str, uniques))]
+    values = pd.array(offsets + [None], dtype='Int16')
+    return pd.Series(values[codes], index=column.index, name=column.name)
+
+
+def convert(chunk: pd.DataFrame, dateformat: str, days: int = 0):
+    """
+    Convert the '#timestamp' and 'utcoffset' text columns of a chunk in place, see parse() and utcoffset().
+    """
+    if '#timestamp' in chunk.columns:
+        chunk['#timestamp'] = parse(chunk['#timestamp'], dateformat, days)
+    if 'utcoffset' in chunk.columns:
+        chunk['utcoffset'] = utcoffset(chunk['utcoffset'])
@@ -0,0 +1,112 @@
+import re
+import numpy as np
+import pandas as pd
+from . import timestamps
+
+# inside quotes, backslash escapes allowed (unrolled loop, no per character alternation)
+_QUOTED = r'[^"\\\n]*(?:\\.[^"\\\n]*)*'
+
+# any field: quoted or up to the next space
+_FIELD = rf'(?:"{_QUOTED}"|[^ \n]*)'
+
+
+def _quoted(name: str) -> str:
+    # quotes stripped, same as read_csv with quotechar '"' and escapechar '\'
+    return rf'(?P<q_{name}>")?(?P<{name}>(?(q_{name}){_QUOTED}|[^ \n]*))(?(q_{name})")'
+
+
+# fields split into several columns in the same pass
+_SPECIAL = {
+    # "GET http://xyz.cdn.de/this/is/the/path?and_this_is_the_query_string HTTP/1.1", query and fragment dropped
+    'request': r'"(?P<method>[^ "\n]*) (?:[a-zA-Z][a-zA-Z0-9+.-]*://(?P<host>[^/?#\\ "\n]*))?'
+               r'(?P<path>[^?#\\ "\n]*(?:\\.[^?#\\ "\n]*)*)(?:[?#][^\\ "\n]*(?:\\.[^\\ "\n]*)*)? '
+               rf'(?P<protocol>{_QUOTED})"',
+    # "89.204.153.53, 127.0.0.1", keep the first IP
+    'xforwardedfor': r'(?P<q_xforwardedfor>")?(?P<xforwardedfor>(?(q_xforwardedfor)[^,"\\\n]*|[^, \n]*))'
+                     r'(?(q_xforwardedfor)[^"\\\n]*(?:\\.[^"\\\n]*)*"|[^ \n]*)',
+}
+
+# columns of the request field, kept as they are like the substrings read_csv and urlsplit give, e.g. an empty host
+# of a request without a scheme
+_REQUEST = ['method', 'host', 'path', 'protocol']
+
+
+class Tokenizer(object):
+    """
+    Columnar tokenizer for the space separated access log formats (see params in process.py). Each line is scanned
+    once by a single regular expression, only the used fields are extracted, the request line is split into method,
+    host, path and protocol, xforwardedfor is cut to the first IP. Lines not matching the format are skipped.
+    """
+
+    def __init__(self, usecols: list, names: list, dateformat: str, encoding: str = 'utf8', na_values: str = '-',
+                 timeshiftdays: int = 0):
+        """
+        :param usecols: field numbers to extract
+        :param names: column names of the fields in usecols
+        :param dateformat: strptime format of the '#timestamp' field
+        :param timeshiftdays: added to the timestamps
+        """
+        assert len(usecols) == len(names), f"usecols and names mismatch: '{usecols}', '{names}'"
+        self._dateformat = dateformat
+        self._timeshiftdays = timeshiftdays
+        self._encoding = encoding
+        self._na_values = na_values
+
+        fieldnames = dict(zip(usecols, names))
+        fields = []
+        for i in range(max(usecols) + 1):
+            if i not in fieldnames:
+                fields.append(_FIELD)
+            elif fieldnames[i] in _SPECIAL:
+                fields.append(_SPECIAL[fieldnames[i]])
+            else:
+                fields.append(_quoted(re.sub(r'\W', '_', fieldnames[i])))
+        self._regex = re.compile('^' + ' '.join(fields) + r'(?: [^\n]*)?$', re.MULTILINE)
+
+        # (group number, column name), the quote groups are dropped
+        self._columns = []
+        for name in names:
+            if name == 'request':
+                self._columns += [(self._regex.groupindex[column], column)
+                                  for column in _REQUEST]
+            else:
+                self._columns.append((self._regex.groupindex[re.sub(r'\W', '_', name)], name))
+
+    def tokenize(self, batch) -> pd.DataFrame:
+        """
+        :param batch: bytes-like, lines of the logfile
+        """
+        text = str(batch, self._encoding)
+        matches = self._regex.findall(text)
+        groups = list(zip(*matches)) if matches else [()] * self._regex.groups
+
+        # escapes are rare, skip the unescaping pass if there are none
+        escaped = '\\' in text
+
+        chunk = pd.DataFrame({name: self._convert(name, np.array(groups[group - 1], dtype=object), escaped)
+                              for group, name in self._columns})
+        return chunk
+
+    def _convert(self, name: str, values: np.ndarray, escaped: bool) -> pd.Series:
+        if name not in _REQUEST:
+            values[(values == '') | (values == self._na_values)] = np.nan
+        column = pd.Series(values, dtype=object)
+
+        if name == '#timestamp':
+            return timestamps.parse(column, self._dateformat, self._timeshiftdays)
+        if name == 'utcoffset':
+            return timestamps.utcoffset(column)
+
+        # type inference, as read_csv does, a non-numeric first value rules it out without a full pass
+        try:
+            first = column.first_valid_index()
+            if first is not None:
+                float(column[first])
+            return pd.to_numeric(column)
+        except (ValueError, TypeError):
+            pass
+
+        # unescape
+        if escaped and column.str.contains('\\', regex=False, na=False).any():
+            column = column.str.replace(r'\\(.)', r'\1', regex=True)
+        return column
@@ -3,42 +3,137 @@ from queue import Empty
 from io import StringIO
 import pandas as pd
 import logging
-import numpy as np
-from cachetools import cached
-from ua_parser import user_agent_parser
-from datetime import timedelta
+from functools import partial
 from geolite2 import geolite2
 from urllib.parse import urlsplit
-from datetime import datetime
-import bz2
 import os
+import time
+from .mydict import substitute, CachedDict
+from .ringbuffer import RingBuffer, MemoryviewReader
+from .tokenizer import Tokenizer
+from .geoindex import GeoIndex
+from .diskcache import DiskCache, TieredCache
+from .hashdict import HashDict
+from .sink import SINKS
+from .batch import FileProgress
+from .metrics import Metrics
+from .profiling import Profiler
+from .prefilter import Prefilter
+from . import enrich, timestamps
+from .enrich import unique_apply, UACOLUMNS, PATHCOLUMNS
 
 os.environ['NUMEXPR_MAX_THREADS'] = '100'
 
+# seconds between the latency reports of streamed batches
+LATENCYREPORT = 60
+
+
+class _Outputs(object):
+    """
+    Sinks of a worker, one per logfile. A single logfile is opened at the start, several are opened by their first
+    batch and closed once complete.
+    """
+
+    def __init__(self, sink, filenames: list, progress: FileProgress = None):
+        """
+        :param sink: opens a sink for a filename
+        """
+        self._sink = sink
+        self._filenames = filenames
+        self._progress = progress
+        self._sinks = {}
+        if len(filenames) == 1:
+            self.get(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def get(self, fileno: int):
+        if fileno not in self._sinks:
+            self._sinks[fileno] = self._sink(self._filenames[fileno])
+        return self._sinks[fileno]
+
+    def close_complete(self):
+        if self._progress is not None:
+            for fileno in [fileno for fileno in self._sinks if self._progress.complete(fileno)]:
+                self._sinks.pop(fileno).close()
+
+    def checkpoint(self) -> tuple:
+        assert len(self._filenames) == 1, "checkpoints need a single logfile"
+        return self.get(0).checkpoint()
+
+    def flush(self):
+        for sink in self._sinks.values():
+            sink.checkpoint()
+
+    def close(self):
+        while self._sinks:
+            self._sinks.popitem()[1].close()
+
 
 class Worker(Process):
-    def __init__(self, no: int, logfilename: str, input: Queue, mydicts: dict, cachename: str,
-                 popname: str, timeshiftdays: int, xyte: float, cachesize: int, **read_csv_args):
+    def __init__(self, no: int, logfilenames: list, input: Queue, mydicts: dict, cachenames: list,
+                 popnames: list, timeshiftdays: int, xyte: float, cachesize: int, tokenizer: bool = False,
+                 geoindex: str = None, enrichcache: str = None, enrichcachesize: int = 1000000,
+                 output: str = 'csv', compression: str = 'bz2', compresslevel: int = None, append: bool = False,
+                 checkpoints: Queue = None, progress: FileProgress = None, flushinterval: float = 0,
+                 metrics: Queue = None, metricsinterval: float = 10, profile: str = None, profileskip: int = 0,
+                 profilebatches: int = 0, prefilter: Prefilter = None, **read_csv_args):
+        """
+        :param logfilenames: output per logfile, indexed by the fileno of the batches
+        :param cachenames: cachename per logfile
+        :param popnames: popname per logfile
+        :param progress: batches of several logfiles, their outputs are closed once complete
+        :param flushinterval: seconds between flushes of the outputs (see Sink.checkpoint()) for streamed batches, the
+        output is readable up to there, 0 flushes at the end only
+        :param metrics: queue of the stage timings and counters to the main process (see metrics.Exporter), sent every
+        metricsinterval seconds
+        :param profile: directory of the profiles (see profiling.Profiler), of profilebatches batches after the first
+        profileskip ones, or of the whole run if profilebatches is 0
+        :param prefilter: drops lines before parsing, the lines dropped per rule are counted in the metrics
+        """
         super().__init__(name=f"Worker-{no}")
         self._no = no
-        self._logfilename = logfilename
+        assert len(logfilenames) == len(cachenames) == len(popnames), "one output, cachename and popname per logfile"
+        assert len(logfilenames) == 1 or progress is not None, "several logfiles need a progress"
+        self._logfilenames = logfilenames
+        self._progress = progress
+        assert flushinterval >= 0, f"invalid flushinterval: '{flushinterval}'"
+        self._flushinterval = flushinterval
         self._input = input
+        self._metrics = metrics
+        self._metricsinterval = metricsinterval
+        self._profiler = Profiler(profile, 'Worker', profileskip, profilebatches)
+        self._prefilter = prefilter if prefilter else None
         self._read_csv_args = read_csv_args
         self._logger = logging.getLogger(self.name)
         self._eof = Event()
 
+        # checkpoint requests, acknowledged on the checkpoints queue (see checkpoint())
+        self._checkpoint = Event()
+        self._proceed = Event()
+        self._checkpoints = checkpoints
+        self._append = append
+
         self._mydicts = mydicts
 
-        assert len(cachename) > 0, f"invalid cachename: '{cachename}'"
-        assert len(popname) > 0, f"invalid cachename: '{popname}'"
-        self._cachename = cachename
-        self._popname = popname
+        for cachename, popname in zip(cachenames, popnames):
+            assert len(cachename) > 0, f"invalid cachename: '{cachename}'"
+            assert len(popname) > 0, f"invalid popname: '{popname}'"
+        self._cachenames = cachenames
+        self._popnames = popnames
 
         # local caches for acceleration
         assert cachesize >= 0, f"Wrong cachesize: {cachesize}"
         self._cachesize = cachesize
-        self._geocache = {}
-        self._uacache = {}
+
+        # persistent cache shared by the workers behind the local ones
+        assert enrichcachesize > 0, f"invalid enrichcachesize: '{enrichcachesize}'"
+        self._enrichcache = enrichcache
+        self._enrichcachesize = enrichcachesize
 
         assert timeshiftdays > 0, f"invalid timeshiftdays: '{timeshiftdays}'"
         self._timeshiftdays = timeshiftdays
@@ -47,19 +142,103 @@ class Worker(Process):
         assert isinstance(read_csv_args, dict), f"wrong type for read_csv_args: '{type(read_csv_args)}'"
         self._read_csv_args = read_csv_args
 
+        # format specific tokenizer instead of read_csv
+        self._tokenizer = tokenizer
+
+        # GeoIP range index file instead of per IP database lookups
+        self._geoindex = geoindex
+
+        assert output in SINKS, f"invalid output: '{output}'"
+        self._output = output
+        self._compression = compression
+        self._compresslevel = compresslevel
+
     def run(self):
+        self._profiler.start()
 
+        # timestamps are parsed once per distinct value and shifted in the same step (see timestamps.py)
         dateformat = self._read_csv_args.pop('dateformat')
-        self._read_csv_args['date_parser'] = lambda x: datetime.strptime(x, dateformat)
 
-        with bz2.BZ2File(self._logfilename, mode='w') as logwriter:
+        tokenizer = Tokenizer(self._read_csv_args['usecols'], self._read_csv_args['names'], dateformat,
+                              self._read_csv_args.get('encoding', 'utf8'),
+                              self._read_csv_args.get('na_values', '-'), self._timeshiftdays) if self._tokenizer else None
+
+        def diskcache(table: str):
+            return DiskCache(self._enrichcache, table, self._enrichcachesize) if self._enrichcache else None
+
+        caches = [TieredCache(enrich.useragent, self._cachesize, diskcache('useragent'))]
+        uaparser = caches[0].map_many
+        if self._geoindex is not None:
+            coordinates = GeoIndex(self._geoindex).coordinates
+        else:
+            caches.append(TieredCache(partial(enrich.coordinates, geolite2.reader()), self._cachesize,
+                                      diskcache('coordinates')))
+            coord = caches[1].map_many
+            coordinates = lambda ips: pd.Series(coord(ips), index=ips.index, dtype=object)
+
+        # the hash mapper substitutes with strings, the others with integers
+        numericids = not any(isinstance(mydict, HashDict) for mydict in self._mydicts.values())
+
+        # the ids seen by this worker, only the misses go to the shared mappers
+        mydicts = {prefix: CachedDict(mydict, self._cachesize) for prefix, mydict in self._mydicts.items()}
+
+        # seconds and rows per stage, the time waited for batches tells a slow reader
+        metrics = Metrics(self.name, self._metrics, self._metricsinterval)
+        for prefix, cache in mydicts.items():
+            metrics.watch(f"mapping_calls_{prefix}", lambda cache=cache: cache.calls)
+            metrics.watch(f"mapping_hits_{prefix}", lambda cache=cache: cache.hits)
+            metrics.watch(f"mapping_misses_{prefix}", lambda cache=cache: cache.misses)
+            metrics.watch(f"mapping_hitrate_{prefix}", lambda cache=cache: cache.hitrate, gauge=True)
+
+        # seqs taken since the last checkpoint
+        taken = []
+
+        # creation times of the streamed batches written since the last flush, latencies since the last report
+        written = []
+        latency = []
+        lastflush = lastreport = time.monotonic()
+
+        sink = partial(SINKS[self._output], mapped=list(self._mydicts), numericids=numericids,
+                       compression=self._compression, compresslevel=self._compresslevel, append=self._append,
+                       metrics=metrics)
+        with _Outputs(sink, self._logfilenames, self._progress) as outputs:
 
             while True:
+                batch = None
 
                 try:
+                    # outputs of the logfiles done
+                    outputs.close_complete()
+
+                    metrics.send()
+
+                    # streamed batches: flush the outputs, the end-to-end latency ends here
+                    if written and (self._flushinterval == 0 or time.monotonic() - lastflush >= self._flushinterval):
+                        if self._flushinterval > 0:
+                            outputs.flush()
+                        now = time.time()
+                        latency.extend(now - created for created in written)
+                        written = []
+                        lastflush = time.monotonic()
+                    if latency and time.monotonic() - lastreport >= LATENCYREPORT:
+                        self._logger.info(self._latency(latency))
+                        latency = []
+                        lastreport = time.monotonic()
+
+                    # checkpoint between batches
+                    if self._checkpoint.is_set():
+                        self._checkpoint.clear()
+                        size, indexsize = outputs.checkpoint()
+                        self._checkpoints.put((self._no, size, indexsize, taken))
+                        taken = []
+
+                        # hold until all workers are at a checkpoint and the mappings are saved
+                        self._proceed.wait()
+
                     # wait for a task
                     try:
-                        batch = self._input.get(block=True, timeout=0.25)
+                        with metrics.stage('wait'):
+                            batch = self._input.get(block=True, timeout=0.25)
                     except Empty:
                         if self._eof.is_set():
                             # no job, and the EOF reached, no hope to get a task, exit
@@ -68,8 +247,36 @@ class Worker(Process):
                             # no job, but EOF not set, reade is behind, expect new tasks
                             continue
 
+                    if isinstance(self._input, RingBuffer):
+                        slot, batch = batch
+
+                    self._profiler.begin()
+
+                    # a failed batch counts as done as well, it is not repeated on resume
+                    taken.append(batch.seq)
+
                     # read csv
-                    chunk = pd.read_csv(StringIO(batch.decode(encoding='utf8')), **self._read_csv_args)
+                    with metrics.stage('parse'):
+                        if isinstance(self._input, RingBuffer):
+                            # parse straight from the shared memory slot, then hand the slot back
+                            try:
+                                data = self._filter(batch.data, metrics)
+                                if tokenizer is not None:
+                                    chunk = tokenizer.tokenize(data)
+                                else:
+                                    chunk = pd.read_csv(MemoryviewReader(data), **self._read_csv_args)
+                            finally:
+                                self._input.release(slot, batch.data)
+                        else:
+                            data = self._filter(batch.data, metrics)
+                            if tokenizer is not None:
+                                chunk = tokenizer.tokenize(data)
+                            else:
+                                chunk = pd.read_csv(StringIO(data.decode(encoding='utf8')), **self._read_csv_args)
+                        if tokenizer is None:
+                            timestamps.convert(chunk, dateformat, self._timeshiftdays)
+                    metrics.add('batches')
+                    metrics.add('rows', len(chunk))
 
                     if self._logger.level == logging.DEBUG:
                         pd.set_option('display.max_columns', None)
@@ -81,7 +288,7 @@ class Worker(Process):
                             or '#timestamp' not in chunk.columns \
                             or 'contenttype' not in chunk.columns \
                             or 'ip' not in chunk.columns \
-                            or 'request' not in chunk.columns \
+                            or ('request' not in chunk.columns and 'path' not in chunk.columns) \
                             or 'statuscode' not in chunk.columns \
                             or 'timetoserv' not in chunk.columns:
                         raise SyntaxError(f"Required column(s) not found: {chunk.columns}")
@@ -91,117 +298,98 @@ class Worker(Process):
                     #########################
                     # filter
 
-                    if 'side' in chunk.columns:
-                        # drop non downstream lines
-                        chunk.drop(chunk.loc[chunk['side'] != 'c'].index, inplace=True)
-                        chunk.drop(['side'], axis=1, inplace=True)
+                    with metrics.stage('filter', len(chunk)):
+                        if 'side' in chunk.columns:
+                            # drop non downstream lines
+                            chunk.drop(chunk.loc[chunk['side'] != 'c'].index, inplace=True)
+                            chunk.drop(['side'], axis=1, inplace=True)
+
+                        # add constant values
+                        chunk['cachename'] = self._cachenames[batch.fileno]
+                        chunk['popname'] = self._popnames[batch.fileno]
 
-                    # add constant values
-                    chunk['cachename'] = self._cachename
-                    chunk['popname'] = self._popname
+                    # nothing left to write, e.g. all lines dropped by the prefilter
+                    if chunk.empty:
+                        continue
 
                     #########################
                     # parse
 
-                    # split xforwarded for, keep the first IP
-                    if 'xforwardedfor' in chunk.columns:
-                        chunk.xforwardedfor = chunk.xforwardedfor.str.split(",", n=1, expand=True)[0]
+                    with metrics.stage('request', len(chunk)):
+                        # split xforwarded for, keep the first IP
+                        if 'xforwardedfor' in chunk.columns:
+                            if tokenizer is None:
+                                chunk.xforwardedfor = chunk.xforwardedfor.str.split(",", n=1).str[0]
 
-                        # overwrite ip with xforwardedfor if it is 127.0.0.1 (TLS termination is from localhost)
-                        mask = chunk['ip'] == '127.0.0.1'
-                        chunk.loc[mask, 'ip'] = chunk.loc[mask, 'xforwardedfor']
-                        self._logger.debug(chunk.head(5))
+                            # overwrite ip with xforwardedfor if it is 127.0.0.1 (TLS termination is from localhost)
+                            mask = chunk['ip'] == '127.0.0.1'
+                            chunk.loc[mask, 'ip'] = chunk.loc[mask, 'xforwardedfor']
+                            self._logger.debug(chunk.head(5))
+
+                            # drop xforwardedfor
+                            chunk.drop(['xforwardedfor'], axis=1, inplace=True)
+                            self._logger.debug(chunk.head(5))
 
-                        # drop xforwardedfor
-                        chunk.drop(['xforwardedfor'], axis=1, inplace=True)
+                        # check if all public
+                        assert True  # TODO: implement
                         self._logger.debug(chunk.head(5))
 
-                    # check if all public
-                    assert True  # TODO: implement
-                    self._logger.debug(chunk.head(5))
+                        # convert timetoserv unit from ms to sec
+                        chunk['timetoserv'] /= 1000000
 
-                    # convert timetoserv unit from ms to sec
-                    chunk['timetoserv'] /= 1000000
+                        # split request line (the tokenizer did this already)
+                        if 'request' in chunk.columns:
+                            chunk['method'], chunk['url'], chunk['protocol'] = zip(
+                                *chunk['request'].str.split(' ', n=2))
+                            chunk.drop(['request'], axis=1, inplace=True)
 
-                    # split request line
-                    chunk['method'], chunk['url'], chunk['protocol'] = zip(*chunk['request'].str.split(' ', n=2))
-                    chunk.drop(['request'], axis=1, inplace=True)
+                            # parse url, skip schema, fragment
+                            dummy_schema, chunk['host'], chunk['path'], dummy_query, dummy_fragment = zip(
+                                *chunk['url'].map(urlsplit))
 
-                    # parse url, skip schema, fragment
-                    dummy_schema, chunk['host'], chunk['path'], dummy_query, dummy_fragment = zip(
-                        *chunk['url'].map(urlsplit))
+                            chunk.drop(['url'], axis=1, inplace=True)
 
-                    chunk.drop(['url'], axis=1, inplace=True)
 
+                    #########################
+                    # enrich - every source column is factorized once, derived columns are computed on the distinct
+                    # values only and expanded back to the rows
 
                     # remove cache name, if present in host (http redirect)
-                    chunk['host'].replace(r'^[a-zA-Z0-9-]+--', '', inplace=True, regex=True)
-                    chunk['host'].replace(r'^[a-zA-Z0-9]+-[a-zA-Z0-9]+-[a-zA-Z0-9]+\.', '', inplace=True, regex=True)
+                    with metrics.stage('host', len(chunk)):
+                        chunk['host'] = unique_apply(chunk['host'], enrich.host)
 
                     # session cookie
                     if 'sessioncookie' in chunk.columns:
-                        dummy = chunk['sessioncookie'].str.extract(
-                            r"session=(?:-|([^,]+)),(?:-|([^,]+)),(?:-|([^,]+)),(?:-|([^,;]+))", expand=True)
-                        chunk['uid'] = dummy[0]
-                        chunk['sid'] = dummy[1]
-                        chunk.drop(['sessioncookie'], axis=1, inplace=True)
-
-                    # channel number (.fillna().sum() takes care of the OR case in the regexp)
-                    chunk['livechannel'] = chunk['path'].str.extract(r'PLTV/88888888/\d+/(\d+)/|([^/]+)\.isml',
-                                                                     expand=False).fillna('').sum(axis=1).replace('',
-                                                                                                                  np.NaN)
-
-                    # contentpackage, assetid
-                    dummy = chunk['path'].str.extract(r"/(\d{18,})/(\d{16,})/")
-                    chunk['contentpackage'] = dummy[0]
-                    chunk['assetnumber'] = dummy[1]
-
-                    #########################
-                    # enrich - geoip, use local cache for performance
-                    geo = geolite2.reader()
-
-                    @cached(cache=self._geocache)
-                    def coord(ip: str) -> str:
-                        geodata = geo.get(ip)
+                        with metrics.stage('session', len(chunk)):
+                            chunk[['uid', 'sid']] = unique_apply(chunk['sessioncookie'], enrich.session)
+                            chunk.drop(['sessioncookie'], axis=1, inplace=True)
 
-                        # round up to 2 digits (~1km precision, see https://wiki.openstreetmap.org/wiki/Precision_of_coordinates)
-                        return f"{round(geodata['location']['longitude'], 2)}:{round(geodata['location']['latitude'], 2)}" if geodata is not None and 'location' in geodata else np.nan
-
-                    chunk['coordinates'] = chunk['ip'].map(coord, na_action='ignore')
-                    chunk.drop(['ip'], axis=1, inplace=True)
-
-                    self._logger.debug(chunk.head(5))
+                    # channel number, contentpackage, assetid, streaming protocol
+                    with metrics.stage('path', len(chunk)):
+                        chunk[PATHCOLUMNS] = unique_apply(chunk['path'], enrich.path)
 
                     #########################
-                    # enrich - user agent, use local cache for performance
-
-                    @cached(cache=self._uacache)
-                    def uaparser(ua_string: str) -> pd.Series:
-                        ps = user_agent_parser.Parse(ua_string)
-                        return pd.Series(
-                            [np.nan if x is None else x for x in
-                             [ps['device']['brand'], ps['device']['family'], ps['device']['model'], ps['os']['family'],
-                              ps['user_agent']['family'], ps['user_agent']['major']]]
-                        )
-
-                    chunk[["devicebrand", "devicefamily", "devicemodel", "osfamily", "uafamily", "uamajor"]] = \
-                        chunk.loc[
-                            chunk['useragent'].notna(), 'useragent'].apply(uaparser)
-                    chunk.drop(['useragent'], axis=1, inplace=True)
+                    # enrich - geoip, range index or database lookups with local cache
+                    with metrics.stage('geo', len(chunk)):
+                        chunk['coordinates'] = unique_apply(chunk['ip'], coordinates)
+                        chunk.drop(['ip'], axis=1, inplace=True)
 
                     self._logger.debug(chunk.head(5))
 
                     #########################
-                    # enrich - streaming protocol
+                    # enrich - user agent, use caches for performance
+                    with metrics.stage('useragent', len(chunk)):
+                        chunk[UACOLUMNS] = unique_apply(
+                            chunk['useragent'],
+                            lambda uas: pd.DataFrame(uaparser(uas), columns=UACOLUMNS, index=uas.index))
+                        chunk.drop(['useragent'], axis=1, inplace=True)
 
-                    chunk['manifest'] = chunk['path'].str.match(r'(?:\.isml?/Manifest|\.mpd|\.m3u8)$', case=False)
-                    chunk['fragment'] = chunk['path'].str.match(
-                        r'(?:\.m4[avi]|\.ts|\.ism[av]|\.mp[4a]|/(?:Fragments|KeyFrames)\(.*\))$', case=False)
+                    self._logger.debug(chunk.head(5))
 
                     #########################
                     # anonymize
 
-                    # substitute: map values to random hashes
+                    # substitute: map values to random hashes, one round trip per column
                     columns = ['cachename', 'popname', 'host', 'coordinates', 'devicebrand',
                                    'devicefamily', 'devicemodel', 'osfamily', 'uafamily', 'uamajor', 'path',
                                    'livechannel', 'contentpackage', 'assetnumber']
@@ -210,17 +398,17 @@ class Worker(Process):
                     if 'sid' in chunk.columns:
                         columns.append('sid')
 
-                    for prefix in columns:
-                        assert prefix in self._mydicts, f"Mapper prefix issue: '{prefix}' not found in '{self._mydicts}'"
-                        chunk[prefix] = chunk[prefix].map(self._mydicts[prefix].map, na_action='ignore')
+                    with metrics.stage('mapping', len(chunk)):
+                        for prefix in columns:
+                            assert prefix in self._mydicts, \
+                                f"Mapper prefix issue: '{prefix}' not found in '{self._mydicts}'"
+                            chunk[prefix] = substitute(chunk[prefix], mydicts[prefix])
 
                     self._logger.debug(chunk.head(5))
 
-                    # shift time
-                    chunk['#timestamp'] += timedelta(days=self._timeshiftdays)
-
-                    # convert byte to xyte
-                    chunk.contentlength = chunk.contentlength.divide(self._xyte)
+                    with metrics.stage('timeshift', len(chunk)):
+                        # the time is shifted by the parse, convert byte to xyte
+                        chunk.contentlength = chunk.contentlength.divide(self._xyte)
 
                     #########################
                     # set index
@@ -230,11 +418,13 @@ class Worker(Process):
                                      'manifest',
                                      'fragment', 'livechannel', 'contentpackage', 'assetnumber']
                     if 'uid' in chunk.columns:
-                        columns.append('uid')
+                        index.append('uid')
                     if 'sid' in chunk.columns:
-                        columns.append('sid')
+                        index.append('sid')
                     if 'cachecontrol' in chunk.columns:
-                        columns.append('cachecontrol')
+                        index.append('cachecontrol')
+                    if 'utcoffset' in chunk.columns:
+                        index.append('utcoffset')
                     chunk.set_index(index,
                                     inplace=True)
 
@@ -242,10 +432,11 @@ class Worker(Process):
                         list(['contentlength', 'timefirstbyte',
                               'timetoserv'])), f"Somethink went wrong, column name mismatch: {chunk.columns}"
 
-                    # write
-                    buff = StringIO()
-                    chunk.to_csv(buff, header=True)
-                    logwriter.write(buff.getvalue().encode('utf-8'))
+                    # write, the compression runs on a thread of the sink (csv)
+                    with metrics.stage('render', len(chunk)):
+                        outputs.get(batch.fileno).write(chunk, batch.seq)
+                    if batch.created > 0:
+                        written.append(batch.created)
 
                 except KeyboardInterrupt:
                     self._logger.info("interrupt")
@@ -253,7 +444,61 @@ class Worker(Process):
 
                 except Exception:
                     self._logger.exception("Skipping batch due to exception.")
-
+                    metrics.add('failed_batches')
+
+                finally:
+                    self._profiler.end()
+
+                    # a failed or empty batch is done as well
+                    if batch is not None and self._progress is not None:
+                        self._progress.done(batch.fileno)
+
+        if self._prefilter is not None:
+            self._logger.info(f"prefilter dropped {self._prefilter.stats()}")
+        for name, cache in zip(['useragent', 'coordinates'], caches):
+            self._logger.info(f"{name} cache: {cache.stats()}")
+            cache.close()
+        # the rest is flushed by the close
+        latency.extend(time.time() - created for created in written)
+        if latency:
+            self._logger.info(self._latency(latency))
+        self._logger.info("mapping cache hit rates: " + ", ".join(
+            f"{prefix} {cache.hitrate:.1%}" for prefix, cache in mydicts.items() if cache.hits + cache.misses > 0))
+        metrics.send(force=True)
+
+    def _filter(self, data, metrics: Metrics):
+        """
+        :return: the lines of data kept by the prefilter
+        """
+        if self._prefilter is None:
+            return data
+        data, dropped = self._prefilter.filter(data)
+        for rule, count in dropped.items():
+            metrics.add(f"prefilter_{rule}", count)
+        return data
+
+    @staticmethod
+    def _latency(latency: list) -> str:
+        quantiles = pd.Series(latency).quantile([0.5, 0.99])
+        return f"latency of {len(latency)} batches from reading the first line to the flush: " \
+               f"median {quantiles[0.5]:.2f} s, 99% {quantiles[0.99]:.2f} s, max {max(latency):.2f} s"
 
     def eof(self):
         self._eof.set()
+
+    def checkpoint(self):
+        """
+        Request a checkpoint: the worker makes its output durable after the current batch, puts
+        (no, output size, index size, seqs taken since the last checkpoint) on the checkpoints queue and waits for
+        proceed(). With all workers held, the batches done are exactly the ones taken from the queue.
+        """
+        assert self._checkpoints is not None, "no checkpoints queue"
+        self._proceed.clear()
+        self._checkpoint.set()
+
+    def proceed(self):
+        self._proceed.set()
+
+    @property
+    def logfilenames(self):
+        return self._logfilenames
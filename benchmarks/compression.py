@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Throughput and output size of the output codecs, compressed inline and on the background writer thread. Between two
+writes the batch is parsed with read_csv, standing in for the work of the worker.
+
+    python -m benchmarks.compression logs/sample.log.bz2.ano-0.bz2
+"""
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+from io import BytesIO
+from time import perf_counter
+import pandas as pd
+from anonymizer.compression import CODECS, BackgroundWriter, open_compressed
+
+# levels to compare per codec
+LEVELS = {'bz2': [1, 9], 'gzip': [1, 6, 9], 'lzma': [0, 6], 'none': [None]}
+
+
+def load(filename: str, maxbytes: int, chunksize: int) -> list:
+    """
+    :return: batches of whole lines, the input is decompressed by its extension
+    """
+    opener = {'.bz2': bz2.open, '.gz': gzip.open, '.xz': lzma.open}.get(os.path.splitext(filename)[1], open)
+    with opener(filename, 'rb') as f:
+        lines = f.readlines(maxbytes)
+    return [b"".join(lines[i:i + chunksize]) for i in range(0, len(lines), chunksize)]
+
+
+def run(batches: list, writer) -> float:
+    start = perf_counter()
+    with writer:
+        for batch in batches:
+            pd.read_csv(BytesIO(batch), header=None, on_bad_lines='skip')
+            writer.write(batch)
+    return perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sample', type=str, help="csv (or other text) sample, may be compressed")
+    parser.add_argument('--maxbytes', type=int, default=64 << 20,
+                        help="Bytes of the sample to use (default: %(default)s)")
+    parser.add_argument('--chunksize', type=int, default=10000,
+                        help="Lines in a batch (default: %(default)s)")
+    args = parser.parse_args()
+
+    batches = load(args.sample, args.maxbytes, args.chunksize)
+    size = sum(map(len, batches))
+    print(f"{args.sample}: {size / 1e6:.1f} MB in {len(batches)} batches\n")
+
+    print(f"{'codec':<8}{'level':>6}{'ratio':>8}{'inline MB/s':>14}{'background MB/s':>18}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'out')
+        for codec in CODECS:
+            for level in LEVELS[codec]:
+                t_inline = run(batches, open_compressed(filename, codec, level))
+                t_background = run(batches, BackgroundWriter(filename, codec, level))
+                ratio = size / os.path.getsize(filename)
+                print(f"{codec:<8}{'-' if level is None else level:>6}{ratio:>8.2f}"
+                      f"{size / t_inline / 1e6:>14.1f}{size / t_background / 1e6:>18.1f}")
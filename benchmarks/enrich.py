@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Per-row vs dedup-first enrichment on a real logfile: unique-to-row ratio of the source columns and the speedup of each
+enrichment step.
+
+    python -m benchmarks.enrich logs/sample.log.bz2 --logformat equuleus_v2
+"""
+import argparse
+import bz2
+from itertools import islice
+from time import perf_counter
+import pandas as pd
+from geolite2 import geolite2
+from anonymizer import enrich
+from anonymizer.enrich import unique_apply, UACOLUMNS
+from anonymizer.formats import LOGFORMATS
+from anonymizer.tokenizer import Tokenizer
+
+
+def timeit(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logfile', type=str)
+    parser.add_argument('--logformat', type=str, default='omd', choices=list(LOGFORMATS),
+                        help="Format of the logfile (default: %(default)s)")
+    parser.add_argument('--chunksize', type=int, default=10000,
+                        help="Lines in a batch, as processed by a worker (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Best of this many runs (default: %(default)s)")
+    args = parser.parse_args()
+
+    with bz2.open(args.logfile, 'rb') as logreader:
+        batch = b"".join(islice(logreader, args.chunksize))
+
+    logformat = LOGFORMATS[args.logformat]
+    chunk = Tokenizer(logformat['usecols'], logformat['names'], logformat['dateformat']).tokenize(batch)
+    rows = len(chunk)
+    print(f"{args.logfile}: {rows} rows\n")
+
+    print(f"{'column':<16}{'uniques':>10}{'ratio':>10}")
+    for column in ['useragent', 'ip', 'host', 'path', 'sessioncookie']:
+        if column in chunk.columns:
+            uniques = chunk[column].nunique()
+            print(f"{column:<16}{uniques:>10}{uniques / rows:>10.3f}")
+    print()
+
+    # no caches on either side, the uncached per-row cost is what the dedup saves
+    geo = geolite2.reader()
+    steps = {
+        'host': (lambda: enrich.host(chunk['host']),
+                 lambda: unique_apply(chunk['host'], enrich.host)),
+        'path': (lambda: enrich.path(chunk['path']),
+                 lambda: unique_apply(chunk['path'], enrich.path)),
+        'coordinates': (lambda: chunk['ip'].map(lambda ip: enrich.coordinates(geo, ip), na_action='ignore'),
+                        lambda: unique_apply(chunk['ip'], lambda ips: ips.map(lambda ip: enrich.coordinates(geo, ip)))),
+        'useragent': (lambda: pd.DataFrame([enrich.useragent(ua) for ua in chunk['useragent'].dropna()],
+                                           columns=UACOLUMNS),
+                      lambda: unique_apply(chunk['useragent'],
+                                           lambda uas: pd.DataFrame([enrich.useragent(ua) for ua in uas],
+                                                                    columns=UACOLUMNS, index=uas.index))),
+    }
+    if 'sessioncookie' in chunk.columns:
+        steps['session'] = (lambda: enrich.session(chunk['sessioncookie']),
+                            lambda: unique_apply(chunk['sessioncookie'], enrich.session))
+
+    print(f"{'step':<16}{'per row [s]':>14}{'unique [s]':>14}{'speedup':>10}")
+    total_rowwise = total_unique = 0
+    for step, (rowwise, unique) in steps.items():
+        t_rowwise = timeit(rowwise, args.repeat)
+        t_unique = timeit(unique, args.repeat)
+        total_rowwise += t_rowwise
+        total_unique += t_unique
+        print(f"{step:<16}{t_rowwise:>14.4f}{t_unique:>14.4f}{t_rowwise / t_unique:>10.1f}x")
+    print(f"{'total':<16}{total_rowwise:>14.4f}{total_unique:>14.4f}{total_rowwise / total_unique:>10.1f}x")
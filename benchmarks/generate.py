@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Synthetic bz2 logfiles in the equuleus_v2 and omd layouts, for benchmarks and tests without real logs. The user agent,
+IP, host, path and session values are drawn from pools of a given cardinality, with Zipf skew (rank k is drawn with
+probability proportional to 1/k^skew, 0 is uniform). The file is written as a series of bz2 streams like pbzip2
+output, so the Reader can decompress it in parallel (see --decoders of process.py).
+
+    python -m benchmarks.generate logs/synthetic.log.bz2 --lines 1000000 --uas 2000 --uaskew 1.2
+"""
+import argparse
+import bz2
+import numpy as np
+import pandas as pd
+from anonymizer.formats import LOGFORMATS
+
+# pooled columns: (default cardinality, default skew)
+COLUMNS = {'ua': (1000, 1.2), 'ip': (50000, 0.8), 'host': (20, 1.0), 'path': (100000, 1.0), 'session': (20000, 0.8)}
+
+# kinds of paths and their share, live HLS, smooth streaming, vod DASH, images
+_PATHKINDS = ['hls', 'smooth', 'dash', 'image']
+_PATHSHARES = [0.4, 0.2, 0.3, 0.1]
+_CONTENTTYPES = {'hls': 'video/MP2T', 'smooth': 'video/mp4', 'dash': 'video/mp4', 'image': 'image/png'}
+
+_STATUSCODES = [200, 206, 304, 404]
+_STATUSSHARES = [0.8, 0.1, 0.08, 0.02]
+
+
+def _distinct(count: int, make):
+    """
+    :param make: called with the number of candidates still needed, returns a list of them
+    :return: list of count distinct values
+    """
+    values = {}
+    while len(values) < count:
+        values.update(dict.fromkeys(make(count - len(values))))
+    return list(values)[:count]
+
+
+def useragents(rnd: np.random.Generator, count: int) -> list:
+    def make(n):
+        v = rnd.integers(0, 10000, size=(n, 4))
+        templates = [
+            lambda a, b, c, d: f"Mozilla/5.0 (Linux; Android {a % 6 + 8}; SM-G{b % 1000:03d}F) AppleWebKit/537.36 "
+                               f"(KHTML, like Gecko) Chrome/{c % 30 + 90}.0.{d}.{a % 200} Mobile Safari/537.36",
+            lambda a, b, c, d: f"AppleCoreMedia/1.0.0.{a % 10 + 15}{chr(65 + b % 8)}{c % 400} (iPhone; U; CPU OS "
+                               f"{a % 10 + 12}_{b % 7} like Mac OS X; en_us)",
+            lambda a, b, c, d: f"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                               f"Chrome/{c % 30 + 90}.0.{d}.{b % 200} Safari/537.36",
+            lambda a, b, c, d: f"Mozilla/5.0 (SMART-TV; Linux; Tizen {a % 4 + 3}.{b % 10}) AppleWebKit/537.36 "
+                               f"(KHTML, like Gecko) SamsungBrowser/{c % 5 + 2}.{d % 10} TV Safari/537.36",
+            lambda a, b, c, d: f"okhttp/{a % 3 + 3}.{b % 12}.{c % 5}",
+            lambda a, b, c, d: f"ExoPlayerLib/2.{a % 18}.{b % 10} (Linux; Android {c % 6 + 8}) {d}",
+            lambda a, b, c, d: f"Lavf/{a % 5 + 56}.{b % 100}.{c % 200}",
+        ]
+        return [templates[i % len(templates)](*row) for i, row in enumerate(v.tolist())]
+    return _distinct(count, make)
+
+
+def ips(rnd: np.random.Generator, count: int) -> list:
+    def make(n):
+        # public IPv4 of a few providers, one in ten IPv6
+        v = rnd.integers(0, 1 << 16, size=(n, 4))
+        firsts = [80, 84, 87, 91, 93, 95, 178, 188, 217]
+        return [f"2a02:{a:x}:{b:x}:{c:x}::{d:x}" if d % 10 == 0 else
+                f"{firsts[a % len(firsts)]}.{b % 256}.{c % 256}.{d % 254 + 1}" for a, b, c, d in v.tolist()]
+    return _distinct(count, make)
+
+
+def hosts(rnd: np.random.Generator, count: int) -> list:
+    # some carry the name of the cache in front (http redirect), see enrich.host()
+    return [f"edge-{'fra' if i % 2 else 'ber'}-{i % 7:02d}.{kind}{i}.cdn.de" if i % 5 == 4 else f"{kind}{i}.cdn.de"
+            for i, kind in zip(range(count), rnd.choice(['live', 'vod', 'img'], size=count).tolist())]
+
+
+def paths(rnd: np.random.Generator, count: int) -> tuple:
+    """
+    :return: (paths, content type of each path)
+    """
+    channels = max(1, min(300, count // 100))
+
+    def make(n):
+        kinds = rnd.choice(_PATHKINDS, size=n, p=_PATHSHARES).tolist()
+        v = rnd.integers(0, 1 << 62, size=(n, 2)).tolist()
+        made = []
+        for kind, (a, b) in zip(kinds, v):
+            channel = a % channels
+            if kind == 'hls':
+                made.append(f"/PLTV/88888888/224/3221225{channel:03d}/index.m3u8" if b % 20 == 0 else
+                            f"/PLTV/88888888/224/3221225{channel:03d}/{b % 10 ** 9}.ts")
+            elif kind == 'smooth':
+                made.append(f"/ch{channel:03d}.isml/Manifest" if b % 20 == 0 else
+                            f"/ch{channel:03d}.isml/Fragments(video={b % 10 ** 12})")
+            elif kind == 'dash':
+                package, asset = f"{a:019d}"[:18], f"{b:019d}"[:16]
+                made.append(f"/{package}/{asset}/manifest.mpd" if b % 20 == 0 else
+                            f"/{package}/{asset}/segment-{a % 3000}.m4v")
+            else:
+                made.append(f"/img/{a % 10 ** 6}/{b % 1000}.png")
+        return made
+
+    values = _distinct(count, make)
+    types = [_CONTENTTYPES['image'] if p.endswith('.png') else
+             _CONTENTTYPES['hls'] if p.endswith('.ts') else 'application/vnd.apple.mpegurl' if p.endswith('.m3u8')
+             else _CONTENTTYPES['dash'] for p in values]
+    return values, types
+
+
+def sessions(rnd: np.random.Generator, count: int) -> list:
+    # uid of logged in users only, the sid always
+    uids = rnd.integers(0, 1 << 40, size=count).tolist()
+    return [f"session={'-' if uid % 4 == 0 else f'u{uid:x}'},INT-{i * 7919 + 1000000},-,-; HttpOnly"
+            for i, uid in enumerate(uids)]
+
+
+def zipf(rnd: np.random.Generator, cardinality: int, skew: float, size: int) -> np.ndarray:
+    """
+    :return: size indices of a pool of cardinality values, the value of rank k drawn with probability proportional
+    to 1/k^skew
+    """
+    weights = 1.0 / np.arange(1, cardinality + 1, dtype=np.float64) ** skew
+    # the ranks are shuffled over the pool, the popular values are not the first generated
+    order = rnd.permutation(cardinality)
+    return order[rnd.choice(cardinality, size=size, p=weights / weights.sum())]
+
+
+def lines(logformat: str, count: int, blocksize: int, pools: dict, args, rnd: np.random.Generator):
+    """
+    :return: generator of blocks of lines as bytes
+    """
+    start = pd.Timestamp(args.start)
+    for first in range(0, count, blocksize):
+        n = min(blocksize, count - first)
+        picked = {name: zipf(rnd, len(pools[name]), getattr(args, f"{name}skew"), n).tolist()
+                  for name in COLUMNS}
+        seconds = (np.arange(first, first + n) * args.duration // count).astype('timedelta64[s]')
+        timestamps = (start + pd.to_timedelta(seconds)).strftime('[%d/%b/%Y:%H:%M:%S').tolist()
+        statuses = rnd.choice(_STATUSCODES, size=n, p=_STATUSSHARES).tolist()
+        lengths = rnd.integers(0, 5 << 20, size=n).tolist()
+        servetimes = rnd.integers(50, 2000000, size=n).tolist()
+        hits = (rnd.random(size=n) < args.hitratio).tolist()
+        uas, addresses, hostnames, pathnames, sessioncookies = [pools[name] for name in COLUMNS]
+        types = pools['contenttype']
+
+        block = []
+        if logformat == 'equuleus_v2':
+            # TLS is terminated locally for half of the clients, their address is in X-Forwarded-For
+            sides = (rnd.random(size=n) < 0.95).tolist()
+            for i in range(n):
+                ip = addresses[picked['ip'][i]]
+                path = picked['path'][i]
+                host = hostnames[picked['host'][i]]
+                block.append(
+                    f"{'127.0.0.1' if i % 2 else ip} - - {timestamps[i]} +0100] "
+                    f"\"GET http://{host}{pathnames[path]} HTTP/1.1\" {statuses[i]} {lengths[i]} \"-\" "
+                    f"\"{uas[picked['ua'][i]]}\" {host} 0.{servetimes[i] % 1000:06d} {servetimes[i]} upstream "
+                    f"{'hit' if hits[i] else 'miss'} - {lengths[i] % 9000} \"{types[path]}\" {lengths[i] * 31} "
+                    f"\"{sessioncookies[picked['session'][i]]}\" \"Cache-Control:public,max-age=300\" "
+                    f"\"ETag:{lengths[i]:032x}\" \"{ip}, 127.0.0.1\" - TLSv1.2 {'c' if sides[i] else 's'}\n")
+        else:
+            epochs = (start.timestamp() + np.arange(first, first + n) * args.duration / count).tolist()
+            for i in range(n):
+                path = picked['path'][i]
+                block.append(
+                    f"{addresses[picked['ip'][i]]} {timestamps[i]} -0000] "
+                    f"\"GET http://{hostnames[picked['host'][i]]}{pathnames[path]} http/1.1\" {statuses[i]} "
+                    f"{lengths[i]} \"-\" \"{uas[picked['ua'][i]]}\" {servetimes[i] % 1000} {servetimes[i] // 1000} "
+                    f"80.156.81.234 {'TCP_HIT' if hits[i] else 'TCP_MISS'} - {lengths[i] + 940} {types[path]} - - "
+                    f"{epochs[i]:.3f}\n")
+        yield "".join(block).encode('utf-8')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logfile', type=str, help="bz2 file to write")
+    parser.add_argument('--logformat', type=str, default='equuleus_v2', choices=list(LOGFORMATS),
+                        help="Layout of the lines (default: %(default)s)")
+    parser.add_argument('--lines', type=int, default=1000000,
+                        help="Number of lines (default: %(default)s)")
+    for name, (cardinality, skew) in COLUMNS.items():
+        parser.add_argument(f'--{name}s', type=int, default=cardinality,
+                            help=f"Distinct {name} values (default: %(default)s)")
+        parser.add_argument(f'--{name}skew', type=float, default=skew,
+                            help=f"Zipf exponent of the {name} values, 0 is uniform (default: %(default)s)")
+    parser.add_argument('--hitratio', type=float, default=0.9,
+                        help="Share of cache hits (default: %(default)s)")
+    parser.add_argument('--start', type=str, default='2022-02-22 22:00:00',
+                        help="Timestamp of the first line (default: %(default)s)")
+    parser.add_argument('--duration', type=int, default=3600,
+                        help="Seconds covered by the lines (default: %(default)s)")
+    parser.add_argument('--streamlines', type=int, default=100000,
+                        help="Lines per bz2 stream (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    assert args.lines > 0, f"invalid lines: '{args.lines}'"
+    assert args.streamlines > 0, f"invalid streamlines: '{args.streamlines}'"
+    rnd = np.random.default_rng(args.seed)
+    pools = {'ua': useragents(rnd, args.uas), 'ip': ips(rnd, args.ips), 'host': hosts(rnd, args.hosts)}
+    pools['path'], pools['contenttype'] = paths(rnd, args.paths)
+    pools['session'] = sessions(rnd, args.sessions)
+
+    size = 0
+    with open(args.logfile, 'wb') as f:
+        for block in lines(args.logformat, args.lines, args.streamlines, pools, args, rnd):
+            size += len(block)
+            f.write(bz2.compress(block))
+    print(f"{args.logfile}: {args.lines} lines, {size / 1e6:.1f} MB decompressed")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Memory and speed of the mapping stores on a synthetic path corpus: MyDict (a dict of str) against CompactDict (hash
+table over flat buffers). The keys are generated batch by batch, as they arrive in the manager process, so the stores
+hold their own copies.
+
+    python -m benchmarks.mapping_memory --keys 2000000
+"""
+import argparse
+import random
+import tracemalloc
+from time import perf_counter
+from anonymizer import MyDict, CompactDict
+
+# path shapes of the logs: segments of live channels and vod assets, manifests, query strings
+_CHANNELS = [f"ch{i:03d}" for i in range(200)]
+_EXTENSIONS = ['m4s', 'ts', 'mp4', 'm3u8', 'mpd']
+
+
+def paths(count: int, batchsize: int, seed: int):
+    """
+    :return: generator of batches of distinct paths
+    """
+    rnd = random.Random(seed)
+    for start in range(0, count, batchsize):
+        batch = []
+        for i in range(start, min(start + batchsize, count)):
+            if rnd.random() < 0.5:
+                batch.append(f"/live/{rnd.choice(_CHANNELS)}/{rnd.choice(['hd', 'sd', 'uhd'])}/"
+                             f"segment-{i}.{rnd.choice(_EXTENSIONS)}")
+            else:
+                batch.append(f"/vod/{rnd.getrandbits(64):016x}/{rnd.randint(1, 9)}/chunk_{i}.{rnd.choice(_EXTENSIONS)}"
+                             f"?token={rnd.getrandbits(32):08x}")
+        yield batch
+
+
+def measure(store, count: int, batchsize: int, seed: int):
+    """
+    :return: (traced memory in bytes, insert seconds, lookup seconds), tracing slows the allocations down, the times
+    are taken on a second store
+    """
+    tracemalloc.start()
+    mydict = store()
+    for batch in paths(count, batchsize, seed):
+        mydict.map_many(batch)
+        del batch
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del mydict
+
+    mydict = store()
+    times = []
+    # new keys, then the same keys again, all hits
+    for _ in range(2):
+        elapsed = 0.0
+        for batch in paths(count, batchsize, seed):
+            start = perf_counter()
+            mydict.map_many(batch)
+            elapsed += perf_counter() - start
+        times.append(elapsed)
+    return memory, times[0], times[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=1000000,
+                        help="Number of distinct paths (default: %(default)s)")
+    parser.add_argument('--batchsize', type=int, default=10000,
+                        help="Keys per map_many call (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'store':<14}{'MB':>10}{'B/key':>10}{'insert [s]':>12}{'lookup [s]':>12}")
+    for store in [MyDict, CompactDict]:
+        memory, insert, lookup = measure(store, args.keys, args.batchsize, args.seed)
+        print(f"{store.__name__:<14}{memory / 1e6:>10.1f}{memory / args.keys:>10.1f}{insert:>12.2f}{lookup:>12.2f}")
+    keybytes = sum(len(key.encode('utf-8')) for batch in paths(args.keys, args.batchsize, args.seed) for key in batch)
+    print(f"\nkeys: {args.keys}, {keybytes / args.keys:.1f} bytes per key on average")
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Per-stage timings of the pipeline and end-to-end runs at several --nproc/--chunksize settings, written as JSON so
+regressions can be tracked between commits. The stages run in this process on the batches of the Reader, one after
+the other as in a worker: parse, enrichment steps, mapping (MyDict behind the per-worker cache, no manager) and write
+(csv sink). The end-to-end runs start process.py in a scratch directory, with fresh secrets each.
+
+    python -m benchmarks.generate logs/synthetic.log.bz2 --lines 1000000
+    python -m benchmarks.run logs/synthetic.log.bz2 --nproc 2 4 8 --chunksize 10000 50000 --results results.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from io import StringIO
+from queue import Empty
+from time import perf_counter
+from urllib.parse import urlsplit
+import pandas as pd
+from geolite2 import geolite2
+from anonymizer import Reader, MyDict, GeoIndex
+from anonymizer import enrich, timestamps
+from anonymizer.diskcache import TieredCache
+from anonymizer.enrich import unique_apply, UACOLUMNS, PATHCOLUMNS
+from anonymizer.compression import CODECS
+from anonymizer.formats import LOGFORMATS
+from anonymizer.mydict import substitute, CachedDict
+from anonymizer.sink import SINKS
+from anonymizer.tokenizer import Tokenizer
+
+# stages timed in process, in pipeline order
+STAGES = ['read', 'parse', 'host', 'session', 'path', 'coordinates', 'useragent', 'mapping', 'write']
+
+# columns substituted by the mappers, see Worker.run()
+PREFIXES = ['cachename', 'popname', 'host', 'coordinates', 'devicebrand', 'devicefamily', 'devicemodel', 'osfamily',
+            'uafamily', 'uamajor', 'path', 'livechannel', 'contentpackage', 'assetnumber', 'uid', 'sid']
+
+PROCESS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'process.py')
+
+
+@contextmanager
+def timer(timings: dict, stage: str):
+    start = perf_counter()
+    yield
+    timings[stage] += perf_counter() - start
+
+
+def read(logfile: str, chunksize: int, maxlines: int, decoders: int) -> tuple:
+    """
+    :return: (seconds, batches), the time of the Reader process from its start to the last batch received
+    """
+    reader = Reader(logfile, chunksize, maxlines, 10, decoders)
+    batches = []
+    start = perf_counter()
+    reader.start()
+    while reader.is_alive() or not reader.queue.empty():
+        try:
+            batches.append(reader.queue.get(timeout=0.1).data)
+        except Empty:
+            pass
+    elapsed = perf_counter() - start
+    reader.join()
+    return elapsed, batches
+
+
+def stages(batches: list, args) -> dict:
+    """
+    Process the batches the way a worker does, timing every stage.
+
+    :return: stage name to seconds
+    """
+    logformat = LOGFORMATS[args.logformat]
+    read_csv_args = dict(encoding='utf8', delimiter=' ', quotechar='"', na_values='-', escapechar='\\', header=None,
+                         on_bad_lines='skip', usecols=logformat['usecols'], names=logformat['names'])
+    tokenizer = Tokenizer(logformat['usecols'], logformat['names'], logformat['dateformat'], timeshiftdays=1) \
+        if args.tokenizer else None
+
+    uaparser = TieredCache(enrich.useragent, args.cachesize).map_many
+    if args.geoindex is not None:
+        coordinates = GeoIndex(args.geoindex).coordinates
+    else:
+        coord = TieredCache(partial(enrich.coordinates, geolite2.reader()), args.cachesize).map_many
+        coordinates = lambda ips: pd.Series(coord(ips), index=ips.index, dtype=object)
+    mydicts = {prefix: CachedDict(MyDict(), args.cachesize) for prefix in PREFIXES}
+
+    timings = dict.fromkeys(STAGES[1:], 0.0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sink = SINKS['csv'](os.path.join(tmpdir, f"out{SINKS['csv'].extension(args.compression)}"), PREFIXES, True,
+                            args.compression)
+        for seq, batch in enumerate(batches):
+            with timer(timings, 'parse'):
+                if tokenizer is not None:
+                    chunk = tokenizer.tokenize(batch)
+                else:
+                    chunk = pd.read_csv(StringIO(batch.decode(encoding='utf8')), **read_csv_args)
+                    timestamps.convert(chunk, logformat['dateformat'], 1)
+                if 'side' in chunk.columns:
+                    chunk = chunk.loc[chunk['side'] == 'c'].drop(['side'], axis=1)
+                chunk['cachename'] = 'bench'
+                chunk['popname'] = 'bench'
+                if 'xforwardedfor' in chunk.columns:
+                    if tokenizer is None:
+                        chunk.xforwardedfor = chunk.xforwardedfor.str.split(",", n=1, expand=True)[0]
+                    mask = chunk['ip'] == '127.0.0.1'
+                    chunk.loc[mask, 'ip'] = chunk.loc[mask, 'xforwardedfor']
+                    chunk.drop(['xforwardedfor'], axis=1, inplace=True)
+                chunk['timetoserv'] /= 1000000
+                if 'request' in chunk.columns:
+                    chunk['method'], chunk['url'], chunk['protocol'] = zip(*chunk['request'].str.split(' ', n=2))
+                    _, chunk['host'], chunk['path'], _, _ = zip(*chunk['url'].map(urlsplit))
+                    chunk.drop(['request', 'url'], axis=1, inplace=True)
+
+            with timer(timings, 'host'):
+                chunk['host'] = unique_apply(chunk['host'], enrich.host)
+            with timer(timings, 'session'):
+                if 'sessioncookie' in chunk.columns:
+                    chunk[['uid', 'sid']] = unique_apply(chunk['sessioncookie'], enrich.session)
+                    chunk.drop(['sessioncookie'], axis=1, inplace=True)
+            with timer(timings, 'path'):
+                chunk[PATHCOLUMNS] = unique_apply(chunk['path'], enrich.path)
+            with timer(timings, 'coordinates'):
+                chunk['coordinates'] = unique_apply(chunk['ip'], coordinates)
+                chunk.drop(['ip'], axis=1, inplace=True)
+            with timer(timings, 'useragent'):
+                chunk[UACOLUMNS] = unique_apply(
+                    chunk['useragent'], lambda uas: pd.DataFrame(uaparser(uas), columns=UACOLUMNS, index=uas.index))
+                chunk.drop(['useragent'], axis=1, inplace=True)
+
+            with timer(timings, 'mapping'):
+                for prefix in [prefix for prefix in PREFIXES if prefix in chunk.columns]:
+                    chunk[prefix] = substitute(chunk[prefix], mydicts[prefix])
+
+            with timer(timings, 'write'):
+                chunk.set_index([column for column in chunk.columns
+                                 if column not in ['contentlength', 'timefirstbyte', 'timetoserv']], inplace=True)
+                sink.write(chunk, seq)
+        with timer(timings, 'write'):
+            sink.close()
+    return timings
+
+
+def endtoend(logfile: str, nproc: int, chunksize: int, args) -> tuple:
+    """
+    :return: (seconds, completed), process.py run on a link to logfile in a scratch directory
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.symlink(os.path.abspath(logfile), os.path.join(tmpdir, os.path.basename(logfile)))
+        os.mkdir(os.path.join(tmpdir, 'secrets'))
+        with open(os.path.join(tmpdir, 'config.ini'), 'w') as f:
+            f.write("[secrets]\ntimeshiftdays = 1\nxyte = 1.0\nhashkey = benchmark\n")
+        command = [sys.executable, PROCESS, os.path.basename(logfile), 'bench', 'bench', '--nproc', str(nproc),
+                   '--chunksize', str(chunksize), '--maxlines', str(args.maxlines), '--logformat', args.logformat,
+                   '--mapper', args.mapper, '--cachesize', str(args.cachesize), '--compression', args.compression,
+                   '--decoders', str(args.decoders)]
+        if args.tokenizer:
+            command.append('--tokenizer')
+        if args.geoindex is not None:
+            command += ['--geoindex', os.path.abspath(args.geoindex)]
+        start = perf_counter()
+        result = subprocess.run(command, cwd=tmpdir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        elapsed = perf_counter() - start
+    return elapsed, "anonymization complete" in result.stderr
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(PROCESS),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logfile', type=str, help="bz2 logfile, see benchmarks.generate")
+    parser.add_argument('--logformat', type=str, default='equuleus_v2', choices=list(LOGFORMATS),
+                        help="Format of the logfile (default: %(default)s)")
+    parser.add_argument('--maxlines', type=int, default=200000,
+                        help="Lines of the logfile to use, -1 for all (default: %(default)s)")
+    parser.add_argument('--nproc', type=int, nargs='+', default=[2, 4],
+                        help="Worker processes of the end-to-end runs (default: %(default)s)")
+    parser.add_argument('--chunksize', type=int, nargs='+', default=[10000, 50000],
+                        help="Chunk sizes of the stage timings and of the end-to-end runs (default: %(default)s)")
+    parser.add_argument('--decoders', type=int, default=1,
+                        help="Decompression processes of the Reader (default: %(default)s)")
+    parser.add_argument('--tokenizer', action='store_true',
+                        help="Parse with the format specific tokenizer instead of read_csv")
+    parser.add_argument('--geoindex', type=str, default=None,
+                        help="GeoIP range index file instead of database lookups")
+    parser.add_argument('--mapper', type=str, default='manager', choices=['manager', 'compact', 'shm', 'hash'],
+                        help="Mapper of the end-to-end runs (default: %(default)s)")
+    parser.add_argument('--cachesize', type=int, default=10000,
+                        help="Per process local cache size (default: %(default)s)")
+    parser.add_argument('--compression', type=str, default='bz2', choices=list(CODECS),
+                        help="Output codec (default: %(default)s)")
+    parser.add_argument('--skip-endtoend', action='store_true',
+                        help="Stage timings only")
+    parser.add_argument('--results', type=str, default=None,
+                        help="JSON file to write the results to (default: benchmark-<time>.json)")
+    args = parser.parse_args()
+
+    started = datetime.now(timezone.utc)
+    results = {
+        'meta': {'started': started.isoformat(timespec='seconds'), 'commit': commit(),
+                 'python': platform.python_version(), 'pandas': pd.__version__, 'platform': platform.platform(),
+                 'cpus': os.cpu_count(), 'args': vars(args)},
+        'stages': [],
+        'endtoend': [],
+    }
+
+    print(f"{'chunksize':>10}" + "".join(f"{stage:>12}" for stage in STAGES) + f"{'lines/s':>12}")
+    for chunksize in args.chunksize:
+        elapsed, batches = read(args.logfile, chunksize, args.maxlines, args.decoders)
+        lines = sum(batch.count(b"\n") for batch in batches)
+        timings = {'read': elapsed, **stages(batches, args)}
+        for stage in STAGES:
+            results['stages'].append({'chunksize': chunksize, 'stage': stage, 'seconds': timings[stage],
+                                      'lines': lines, 'linespersec': lines / timings[stage]})
+        print(f"{chunksize:>10}" + "".join(f"{timings[stage]:>12.3f}" for stage in STAGES) +
+              f"{lines / sum(timings.values()):>12.0f}")
+
+    if not args.skip_endtoend:
+        print(f"\n{'nproc':>6}{'chunksize':>10}{'seconds':>10}{'lines/s':>12}")
+        for nproc in args.nproc:
+            for chunksize in args.chunksize:
+                elapsed, completed = endtoend(args.logfile, nproc, chunksize, args)
+                results['endtoend'].append({'nproc': nproc, 'chunksize': chunksize, 'seconds': elapsed,
+                                            'lines': lines, 'linespersec': lines / elapsed, 'completed': completed})
+                print(f"{nproc:>6}{chunksize:>10}{elapsed:>10.2f}{lines / elapsed:>12.0f}"
+                      f"{'' if completed else '  (failed)'}")
+
+    filename = args.results or f"benchmark-{started.strftime('%Y%m%dT%H%M%S')}.json"
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {filename}")
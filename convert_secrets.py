@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import argparse
+import configparser
+import logging
+import os
+import re
+from anonymizer import HashDict
+
+parser = argparse.ArgumentParser(
+    description="Convert secrets/secrets_<prefix>.csv files into secrets/lookup_<prefix>.csv files for the hash mapper, "
+                "so already published ids stay stable.")
+parser.add_argument('secrets', type=str, nargs='+', help="secrets_<prefix>.csv files to convert")
+parser.add_argument('--configfile', type=str, default='config.ini', help='etc...')
+
+if __name__ == "__main__":
+    try:
+        # arguments
+        args = parser.parse_args()
+
+        # logging
+        logging.basicConfig(level=logging.INFO)
+
+        # config
+        config = configparser.ConfigParser()
+        config.read(args.configfile)
+
+        for secretsfile in args.secrets:
+            match = re.fullmatch(r"secrets_(.+)\.csv", os.path.basename(secretsfile))
+            if match is None:
+                raise ValueError(f"Unexpected secrets file name: '{secretsfile}'")
+            prefix = match.group(1)
+
+            lookupfile = os.path.join(os.path.dirname(secretsfile), f"lookup_{prefix}.csv")
+            HashDict(config['secrets'].get('hashkey').encode('utf-8'), prefix, HashDict.DIGEST_SIZE).convert(
+                secretsfile, lookupfile)
+            logging.info(f"{secretsfile} converted to {lookupfile}")
+
+    except Exception:
+        logging.exception("Error in conversion")
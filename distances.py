@@ -1,58 +1,156 @@
 import pandas as pd
 import argparse
+import logging
 import numpy as np
-from math import sin, cos, sqrt, atan2, radians
+from multiprocessing import Pool, cpu_count
+from tqdm.auto import tqdm
+from anonymizer import journal
 
 parser = argparse.ArgumentParser()
-parser.add_argument('coordinates', type=str)
+parser.add_argument('coordinates', type=str, help="secrets_coordinates.csv or .journal")
 parser.add_argument('output', type=str)
 parser.add_argument('--resolution', type=int, default=5,
-                    help="in km, distance values rounded up to this (default: %(default)s)")
+                    help="in km, distance values rounded to this (default: %(default)s)")
 parser.add_argument('--cap', type=int, default=150,
                     help="in km, distances over this value dropped (default: %(default)s)")
+parser.add_argument('--nproc', type=int, default=cpu_count(),
+                    help="Number of processes computing the blocks of points (default: %(default)s)")
+parser.add_argument('--blocksize', type=int, default=1000,
+                    help="Points per block, the pairs of a block are held in memory at once (default: %(default)s)")
 
+# approximate radius of earth in km
+R = 6373.0
 
-def dist(a_lat, a_lon, b_lat, b_lon, resolution, cap):
-    # approximate radius of earth in km
-    R = 6373.0
 
-    lat1 = radians(a_lat)
-    lon1 = radians(a_lon)
-    lat2 = radians(b_lat)
-    lon2 = radians(b_lon)
+def dist(a_lat, a_lon, b_lat, b_lon):
+    """
+    Haversine distance in km, of arrays of degrees.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (a_lat, a_lon, b_lat, b_lon))
 
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
 
-    # round up to resolution km
-    distance = R * c
-    return np.nan if distance > cap else resolution * round(distance / resolution)
+def read(filename: str) -> pd.DataFrame:
+    """
+    :return: hash, lat and lon of the coordinates in a secrets file, the keys are lon:lat (see enrich.coordinates())
+    """
+    if journal.isjournal(filename):
+        keys, ids = [], []
+        for blockkeys, blockids in journal.read(filename):
+            keys += [key.decode('utf-8') for key in blockkeys]
+            ids.append(blockids)
+        df = pd.DataFrame({'coord': keys, 'hash': np.concatenate(ids) if ids else []})
+    else:
+        df = pd.read_csv(filename, delimiter=',', names=['coord', 'hash'])
+
+    dummy = df['coord'].str.split(':', n=1, expand=True)
+    return pd.DataFrame({'hash': df['hash'], 'lat': dummy[1].astype(float), 'lon': dummy[0].astype(float)})
+
+
+class Grid(object):
+    """
+    Points sorted by their cell in a 3D grid of cap km cubes around the earth. The chord between two points is not
+    longer than their distance on the surface, so points within cap are in the same or in adjacent cells, also at
+    the poles and across the antimeridian.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cap: float):
+        assert cap > 0, f"invalid cap: '{cap}'"
+        lat, lon = np.radians(lat), np.radians(lon)
+        xyz = R * np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+        # cells from 1, the neighbours of all cells are in range
+        cells = np.floor(xyz / cap).astype(np.int64)
+        cells -= cells.min(axis=0, initial=0) - 1
+        size = int(cells.max(initial=0)) + 2
+        keys = (cells[:, 0] * size + cells[:, 1]) * size + cells[:, 2]
+
+        self.order = np.argsort(keys, kind='stable')
+        self._keys = keys[self.order]
+
+        # adjacent cells with a greater key only, the pairs with the others are found from those
+        deltas = np.array([(x * size + y) * size + z for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)])
+        self._deltas = deltas[deltas > 0]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def pairs(self, start: int, stop: int) -> tuple:
+        """
+        :return: positions a and b (in the sorted order, a < b) of the pairs of the points start to stop with the
+        points after them in their own cell and the points in the adjacent cells, each pair once
+        """
+        keys = self._keys[start:stop]
+        firsts = [np.arange(start + 1, stop + 1)]
+        lasts = [np.searchsorted(self._keys, keys, side='right')]
+        for delta in self._deltas:
+            firsts.append(np.searchsorted(self._keys, keys + delta, side='left'))
+            lasts.append(np.searchsorted(self._keys, keys + delta, side='right'))
+        firsts = np.concatenate(firsts)
+        counts = np.concatenate(lasts) - firsts
+
+        a = np.repeat(np.tile(np.arange(start, stop), len(self._deltas) + 1), counts)
+        b = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(firsts, counts)
+        return a, b
+
+
+# points of the pool processes, see _init()
+_points = None
+
+
+def _init(grid: Grid, hashes: np.ndarray, lat: np.ndarray, lon: np.ndarray, resolution: int, cap: int,
+          blocksize: int):
+    global _points
+    _points = (grid, hashes, lat, lon, resolution, cap, blocksize)
+
+
+def distances(start: int) -> pd.DataFrame:
+    """
+    :return: hash_a, hash_b, distance of the pairs of the block of points from start within cap, rounded to resolution
+    """
+    grid, hashes, lat, lon, resolution, cap, blocksize = _points
+    a, b = grid.pairs(start, min(start + blocksize, len(grid)))
+    distance = dist(lat[a], lon[a], lat[b], lon[b])
+    within = distance <= cap
+    a, b = a[within], b[within]
+    return pd.DataFrame({'hash_a': hashes[a], 'hash_b': hashes[b],
+                         'distance': (resolution * np.round(distance[within] / resolution)).astype(np.int64)})
 
 
 if __name__ == "__main__":
     # arguments
     args = parser.parse_args()
+    assert args.resolution > 0, f"invalid resolution: '{args.resolution}'"
+    assert args.nproc > 0, f"invalid nproc: '{args.nproc}'"
+    assert args.blocksize > 0, f"invalid blocksize: '{args.blocksize}'"
+
+    # logging
+    logging.basicConfig(level=logging.INFO)
 
     # read coordinate secret
-    df = pd.read_csv(args.coordinates, delimiter=',', names=['coord', 'hash'])
+    df = read(args.coordinates)
+    logging.info(f"{len(df)} coordinates read from {args.coordinates}")
 
-    # split, parse, set index
-    dummy = df['coord'].str.split(':', n=1, expand=True)
-    df['lat'] = dummy[0].astype(float)
-    df['lon'] = dummy[1].astype(float)
-    df.drop(['coord'], axis=1, inplace=True)
-    print(df)
-
-    # create a matrix with nan
-    distances = pd.DataFrame(
-        [[
-            dist(lat_a, lon_a, lat_b, lon_b, args.resolution, args.cap)
-            for hash_a, lat_a, lon_a in df.values]
-            for hash_b, lat_b, lon_b in df.values
-        ], index=df['hash'], columns=df['hash'])
-    print(distances)
-
-    distances.to_csv(args.output, sep=',', header=True)
+    # points sorted by grid cell
+    grid = Grid(df['lat'].values, df['lon'].values, args.cap)
+    points = (grid, df['hash'].values[grid.order], df['lat'].values[grid.order], df['lon'].values[grid.order],
+              args.resolution, args.cap, args.blocksize)
+
+    # long format, each pair within cap once
+    pairs = 0
+    with open(args.output, 'w') as f:
+        f.write("hash_a,hash_b,distance\n")
+        starts = range(0, len(grid), args.blocksize)
+        if args.nproc > 1:
+            with Pool(args.nproc, initializer=_init, initargs=points) as pool:
+                for block in tqdm(pool.imap(distances, starts), total=len(starts), unit='block'):
+                    block.to_csv(f, header=False, index=False)
+                    pairs += len(block)
+        else:
+            _init(*points)
+            for block in tqdm(map(distances, starts), total=len(starts), unit='block'):
+                block.to_csv(f, header=False, index=False)
+                pairs += len(block)
+    logging.info(f"{pairs} pairs within {args.cap} km written to {args.output}")
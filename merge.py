@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import logging
+from anonymizer.merge import merge
+from anonymizer.sink import SINKS
+from anonymizer.compression import CODECS
+
+parser = argparse.ArgumentParser(
+    description="Merge the per worker outputs <logfile>.ano-<i>.* of process.py into <logfile>.ano.*, in the order of "
+                "the logfile or by timestamp.")
+parser.add_argument('logfile', type=str)
+parser.add_argument('--output', type=str, default='csv', choices=list(SINKS),
+                    help="Output format used by process.py (default: %(default)s)")
+parser.add_argument('--compression', type=str, default='bz2', choices=list(CODECS),
+                    help="Codec of the csv output used by process.py, the merged file is written with the same (default: %(default)s)")
+parser.add_argument('--compresslevel', type=int, default=None,
+                    help="Compression level of the merged file (default: 9 for bz2, 6 for gzip and lzma)")
+parser.add_argument('--by', type=str, default='seq', choices=['seq', 'timestamp'],
+                    help="Order of the logfile, or by #timestamp (csv only) (default: %(default)s)")
+parser.add_argument('--window', type=int, default=1000000,
+                    help="Rows held back for reordering by timestamp (default: %(default)s)")
+
+if __name__ == "__main__":
+    try:
+        # arguments
+        args = parser.parse_args()
+
+        # logging
+        logging.basicConfig(level=logging.INFO)
+
+        extension = SINKS[args.output].extension(args.compression)
+        filenames = sorted(glob.glob(f"{glob.escape(args.logfile)}.ano-[0-9]*{extension}"))
+        if not filenames:
+            raise FileNotFoundError(f"No worker outputs found for {args.logfile}")
+
+        output = f"{args.logfile}.ano{extension}"
+        merge(filenames, output, args.output, args.compression, args.compresslevel, args.by, args.window)
+        logging.info(f"{len(filenames)} files merged into {output}")
+
+    except Exception:
+        logging.exception("Error in merge")
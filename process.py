@@ -1,25 +1,56 @@
 #!/usr/bin/env python3
 import argparse
-from multiprocessing import cpu_count
+import csv
+import glob
+import os
+import re
+import signal
+import stat
+import time
+from multiprocessing import cpu_count, Queue
+from queue import Empty
 import configparser
-from anonymizer import Reader, Worker, MyDict
+from anonymizer import Reader, StreamReader, Worker, MyDict, CompactDict, SharedDict, HashDict, RingBuffer, GeoIndex
+from anonymizer.batch import FileProgress
+from anonymizer.formats import LOGFORMATS
+from anonymizer.sink import SINKS
+from anonymizer.compression import CODECS
+from anonymizer.merge import merge
+from anonymizer.checkpoint import Checkpoint
+from anonymizer.metrics import Exporter
+from anonymizer.prefilter import Prefilter
+from anonymizer import journal
+from anonymizer import profiling
 import logging
 from multiprocessing.managers import BaseManager
+from geolite2 import geolite2
 
 parser = argparse.ArgumentParser()
-parser.add_argument('logfile', type=str)
-parser.add_argument('cachename', type=str)
-parser.add_argument('popname', type=str)
+parser.add_argument('logfile', type=str, nargs='?')
+parser.add_argument('cachename', type=str, nargs='?')
+parser.add_argument('popname', type=str, nargs='?')
+parser.add_argument('--inputs', type=str, default=None,
+                    help="Process many logfiles with one worker pool, loading and saving the secrets once: csv file of pattern,cachename,popname lines, pattern is a glob (e.g. logs/edge1/*.log.bz2), instead of the logfile, cachename and popname arguments. Outputs are written per logfile")
+parser.add_argument('--readers', type=int, default=2,
+                    help="Logfiles read at the same time with --inputs (default: %(default)s)")
 parser.add_argument('--nproc', type=int, default=max(2, cpu_count() - 2),
                     help="Number of worker processes to start (default: %(default)s)")
 parser.add_argument('--cachesize', type=int, default=10000,
-                    help="Per process local cache size (default: %(default)s)")
+                    help="Per process local cache size, of the enrichments and of the ids per mapper prefix (default: %(default)s)")
 parser.add_argument('--maxlines', type=int, default=-1,
                     help="Number of rows of file to read (default: %(default)s)")
 parser.add_argument('--chunksize', type=int, default=10000,
                     help="Chunk (lines processed together) size (default: %(default)s)")
+parser.add_argument('--batchbytes', type=int, default=0,
+                    help="Cut batches of this many decompressed bytes at line ends instead of --chunksize lines, 0 disables (default: %(default)s)")
 parser.add_argument('--queuelen', type=int, default=5,
                     help="Length of the inter process queue (default: %(default)s). Use it to control read-ahead...")
+parser.add_argument('--slotsize', type=int, default=0,
+                    help="Pass batches to the workers in a shared memory ring of --queuelen slots of this many bytes, 0 sends them through the queue (default: %(default)s)")
+parser.add_argument('--decoders', type=int, default=1,
+                    help="Number of bz2 decompressor processes in the reader, more than 1 needs a multi-stream bz2 file, e.g. pbzip2 output (default: %(default)s)")
+parser.add_argument('--decodeahead', type=int, default=512 << 20,
+                    help="Decompressed bytes the --decoders of a reader hold ahead of it, memory taken on top of the queue. Pieces of ~8 MB compressed are decoded, one at least and two per decoder at most (default: %(default)s)")
 parser.add_argument('--encoding', type=str, default='utf8',
                     help="Encoding to use when reading/writing (default: %(default)s)")
 parser.add_argument('--delimiter', type=str, default=' ',
@@ -30,11 +61,96 @@ parser.add_argument('--navalues', type=str, default='-',
                     help="Additional strings to recognize as NA/NaN. (default: %(default)s)")
 parser.add_argument('--escapechar', type=str, default='\\',
                     help="One-character string used to escape other characters (default: %(default)s)")
+parser.add_argument('--logformat', type=str, default='omd', choices=list(LOGFORMATS),
+                    help="Format of the logfile (default: %(default)s)")
+parser.add_argument('--tokenizer', action='store_true',
+                    help="Parse with the format specific tokenizer instead of read_csv, lines not matching the format are skipped")
+parser.add_argument('--mapper', type=str, default='manager', choices=['manager', 'compact', 'shm', 'hash'],
+                    help="Mapping backend: one manager server process per prefix with a dict, the same with a compact hash table (a fraction of the memory for large key spaces), a shared memory hash table per prefix read by all workers directly, or a stateless keyed hash (hashkey in the config file, see also convert_secrets.py) (default: %(default)s)")
+parser.add_argument('--shmcapacity', type=int, default=1 << 20,
+                    help="Initial number of hash table slots per prefix for the shm mapper, at most 75%% can be used, grown by half when full (default: %(default)s)")
+parser.add_argument('--shmarena', type=int, default=64 << 20,
+                    help="Initial bytes reserved for the keys per prefix for the shm mapper, grown by half when full (default: %(default)s)")
+parser.add_argument('--secrets', type=str, default='csv', choices=['csv', 'journal'],
+                    help="Format of the manager, compact and shm mapper secrets: csv rewritten on every save, or a binary append-only journal per prefix taking only the new entries, compacted now and then (converted from the csv on first use) (default: %(default)s)")
+parser.add_argument('--geoindex', type=str, default=None,
+                    help="GeoIP range index file, built from the GeoLite2 database if missing or outdated, mapped by all workers (default: per IP database lookups)")
+parser.add_argument('--enrichcache', type=str, default=None,
+                    help="Persistent user agent and GeoIP result cache (sqlite file), shared by the workers and kept between runs (default: per process caches only)")
+parser.add_argument('--enrichcachesize', type=int, default=1000000,
+                    help="Maximum number of entries per table in the enrichment cache, least recently used are evicted (default: %(default)s)")
+parser.add_argument('--output', type=str, default='csv', choices=list(SINKS),
+                    help="Output format: bz2 compressed csv, or columnar parquet (row group per batch) or arrow IPC stream (record batch per batch) with integer/dictionary encoded columns, the columnar ones need pyarrow (default: %(default)s)")
+parser.add_argument('--compression', type=str, default='bz2', choices=list(CODECS),
+                    help="Codec of the csv output, compressed on a background thread per worker (default: %(default)s)")
+parser.add_argument('--compresslevel', type=int, default=None,
+                    help="Compression level of the codec (default: 9 for bz2, 6 for gzip and lzma)")
+parser.add_argument('--merge', type=str, default=None, choices=['seq', 'timestamp'],
+                    help="Merge the worker outputs into one file at the end, in the order of the logfile or by #timestamp (csv only), see also merge.py (default: separate files)")
+parser.add_argument('--checkpoint', type=int, default=0,
+                    help="Seconds between checkpoints: the worker outputs are synced at a batch boundary and the mappings saved, csv output only, 0 disables (default: %(default)s)")
+parser.add_argument('--resume', action='store_true',
+                    help="Continue from the last checkpoint of the logfile, run with the same parameters")
+parser.add_argument('--follow', action='store_true',
+                    help="Stream the logfile as it grows (tail -F, also after rotation) until Ctrl-C or SIGTERM. A logfile of - (stdin) or a FIFO is streamed until its end, plain text only")
+parser.add_argument('--maxdelay', type=float, default=1.0,
+                    help="Seconds a streamed line waits at most for its chunk to fill (default: %(default)s)")
+parser.add_argument('--flushinterval', type=float, default=10,
+                    help="Seconds between flushes of the streamed outputs, readable up to there, csv output only, 0 flushes at the end only (default: %(default)s)")
+parser.add_argument('--metrics', type=str, default=None,
+                    help="File of the seconds and rows per stage of the readers and workers, queue depth, time blocked on the queue, mapping calls and cache hit rates: JSON with the totals per role, or a Prometheus textfile if it ends with .prom (default: none)")
+parser.add_argument('--metricsinterval', type=float, default=10,
+                    help="Seconds between the updates of the --metrics file (default: %(default)s)")
+parser.add_argument('--methods', type=str, default=None,
+                    help="Request methods kept, comma separated (e.g. GET,HEAD), other lines are dropped before parsing, as are the non downstream lines of formats with a side field (default: all)")
+parser.add_argument('--statuses', type=str, default=None,
+                    help="Range of the status codes kept (e.g. 100-599), other lines are dropped before parsing (default: all)")
+parser.add_argument('--allowhosts', type=str, default=None,
+                    help="Hosts kept, comma separated fnmatch patterns (e.g. *.cdn.de), other lines are dropped before parsing, lines without a host in the request are kept (default: all)")
+parser.add_argument('--denyhosts', type=str, default=None,
+                    help="Hosts dropped before parsing, comma separated fnmatch patterns (e.g. *%%*,*<*), also if allowed (default: none)")
+parser.add_argument('--profile', type=str, default=None,
+                    help="Directory of the cProfile stats of the processes, merged into one <role>.pstats per role (Reader, Worker, Manager...), open them with pstats or snakeviz. The readers, managers and threads (up to Python 3.11) are profiled for the whole run (default: none)")
+parser.add_argument('--profileskip', type=int, default=0,
+                    help="Batches of a worker not profiled first, e.g. warming up the caches (default: %(default)s)")
+parser.add_argument('--profilebatches', type=int, default=0,
+                    help="Batches of a worker profiled after the skipped ones, 0 profiles the whole run (default: %(default)s)")
 parser.add_argument('--configfile', type=str, default='config.ini', help='etc...')
 
 config = configparser.ConfigParser()
 
+
+def init_manager(ignoreint: bool, profile: str):
+    # managers are stopped by the main process at the end of a stream
+    if ignoreint:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    profiling.start(profile, 'Manager')
+
+
+def take_acks(acks: Queue, workers: list, timeout: float = 600) -> list:
+    """
+    :return: the checkpoint acks of all workers, RuntimeError if a worker exits or none comes within timeout seconds
+    """
+    taken = []
+    deadline = time.monotonic() + timeout
+    while len(taken) < len(workers):
+        try:
+            taken.append(acks.get(timeout=1))
+            deadline = time.monotonic() + timeout
+        except Empty:
+            dead = [worker.name for worker in workers if not worker.is_alive()]
+            if dead:
+                raise RuntimeError(f"{', '.join(dead)} exited before the checkpoint")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"no checkpoint from {len(workers) - len(taken)} workers in {timeout} s")
+    return taken
+
+
 if __name__ == "__main__":
+    managers = []
+    mydicts = {}
+    queue = None
+    profile = None
     try:
         # arguments
         args = parser.parse_args()
@@ -45,6 +161,47 @@ if __name__ == "__main__":
         # config
         config.read(args.configfile)
 
+        # logfiles with their cachename and popname
+        if args.inputs is not None:
+            assert args.logfile is None, "either the logfile, cachename and popname arguments or --inputs"
+            assert args.checkpoint == 0 and not args.resume, "checkpoints need a single logfile"
+            logfiles = {}
+            with open(args.inputs, newline='') as f:
+                for row in csv.reader(f):
+                    if not row or row[0].startswith('#'):
+                        continue
+                    pattern, cachename, popname = [field.strip() for field in row]
+                    # outputs of earlier runs may match the pattern as well
+                    matched = [logfile for logfile in sorted(glob.glob(pattern))
+                               if not re.search(r"\.ano(-\d+)?\.[^/]*$", logfile)]
+                    if not matched:
+                        logging.warning(f"No logfiles match {pattern}")
+                    for logfile in matched:
+                        logfiles.setdefault(logfile, (logfile, cachename, popname))
+            logfiles = list(logfiles.values())
+        else:
+            assert args.popname is not None, "logfile, cachename and popname arguments, or --inputs are needed"
+            logfiles = [(args.logfile, args.cachename, args.popname)]
+        assert len(logfiles) > 0, "no logfiles to process"
+
+        # stdin, a FIFO or a followed logfile are streamed in micro-batches
+        stream = args.logfile is not None and (args.follow or args.logfile == '-' or
+                                               stat.S_ISFIFO(os.stat(args.logfile).st_mode))
+        if stream:
+            assert args.checkpoint == 0 and not args.resume, "streams can not be checkpointed"
+            assert args.flushinterval == 0 or SINKS[args.output].RESUMABLE, f"{args.output} output can not be flushed"
+            # Ctrl-C and SIGTERM end the stream, the lines read so far are processed (see StreamReader.stop())
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+        assert args.readers > 0, f"invalid readers: '{args.readers}'"
+
+        if args.profile is not None:
+            os.makedirs(args.profile, exist_ok=True)
+            profile = args.profile
+
+        assert args.checkpoint >= 0, f"invalid checkpoint: '{args.checkpoint}'"
+        assert (args.checkpoint == 0 and not args.resume) or SINKS[args.output].RESUMABLE, \
+            f"{args.output} output can not be checkpointed"
+
         # params
         params = [('cachename', 4), ('popname', 4), ('host', 8), ('coordinates', 8),
                   ('devicebrand', 4), ('devicefamily', 4), ('devicemodel', 4), ('osfamily', 4), ('uafamily', 4),
@@ -59,61 +216,114 @@ if __name__ == "__main__":
                     4, 4, 4, 16, 4, 8, 8,
                     12, 12]
 
-        # register
-        BaseManager.register('MyDict', MyDict)
+        if args.mapper in ['manager', 'compact']:
+            # register
+            BaseManager.register('MyDict', MyDict)
+            BaseManager.register('CompactDict', CompactDict)
 
-        # managers
-        managers = [BaseManager() for prefix in prefixes]
+            # managers
+            managers = [BaseManager() for prefix in prefixes]
 
-        # start
-        list(map(lambda manager: manager.start(), managers))
+            # start
+            list(map(lambda manager: manager.start(init_manager, (stream, profile)), managers))
 
-        # shared dicts
-        mydicts = {prefix: manager.MyDict() for prefix, manager, hashlen in zip(prefixes, managers, hashlens)}
+            # shared dicts
+            if args.mapper == 'manager':
+                mydicts = {prefix: manager.MyDict() for prefix, manager, hashlen in zip(prefixes, managers, hashlens)}
+            else:
+                mydicts = {prefix: manager.CompactDict() for prefix, manager in zip(prefixes, managers)}
+        elif args.mapper == 'shm':
+            # shared memory tables, no server processes
+            mydicts = {prefix: SharedDict(args.shmcapacity, args.shmarena) for prefix in prefixes}
+        else:
+            # keyed hashes, nothing shared
+            mydicts = {prefix: HashDict(config['secrets'].get('hashkey').encode('utf-8'), prefix, hashlen)
+                       for prefix, hashlen in zip(prefixes, hashlens)}
 
-        # load from disk
-        list(map(lambda mydict, prefix: mydict.load(f"secrets/secrets_{prefix}.csv"), mydicts.values(), prefixes))
+        # load from disk, the hash mapper loads the lookups of the published ids only
+        secrets = 'lookup' if args.mapper == 'hash' else 'secrets'
+        extension = journal.EXTENSION if args.secrets == 'journal' and args.mapper != 'hash' else '.csv'
+        secretsfiles = [f"secrets/{secrets}_{prefix}{extension}" for prefix in prefixes]
+        for mydict, secretsfile, prefix in zip(mydicts.values(), secretsfiles, prefixes):
+            # the first journal starts with the csv content, saved in whole
+            if journal.isjournal(secretsfile) and not os.path.exists(secretsfile):
+                secretsfile = f"secrets/{secrets}_{prefix}.csv"
+            mydict.load(secretsfile)
 
-        # create reader and writer processes
-        reader = Reader(args.logfile, args.chunksize, args.maxlines, args.queuelen)
+        # build the GeoIP range index once, workers map the file
+        if args.geoindex is not None and not GeoIndex.is_current(args.geoindex, geolite2.reader()):
+            logging.info(f"Building GeoIP range index {args.geoindex}, this takes a few minutes...")
+            GeoIndex.build(args.geoindex, geolite2.reader())
 
-        # start worker processes with initializer (worker parameters and secrets)
-        # open raw logfile
-        # create progress bar for file position
-        # create progress bar for processed lines
-
-        params = {'equuleus_v2': {}, 'omd': {}}
-
-        # X             X                            X                                                                              X   X     X                         X        X           X         X                                                                X                                                            X
-        # 0         1 2 3                     4      5                                                                              6   7 8   9              10         11       12  13      14  15 16 17                 18      19                                    20                                                 21 22     23
-        # 127.0.0.1 - - [22/Feb/2222:22:22:22 +0100] "GET http://xyz.cdn.de/this/is/the/path?and_this_is_the_query_string HTTP/1.1" 304 0 "-" "okhttp/4.9.0" xyz.cdn.de 0.000130 215 upstrea hit - 614 "application/json" 6596557 "session=-,INT-4178154,-,-; HttpOnly" "2222:22:2222:2222:2222:2222:2222:2222, 127.0.0.1" - TLSv1.2 c
+        # worker outputs per logfile, the batches are cut the same way after a resume, and written to the same files
+        extension = SINKS[args.output].extension(args.compression)
+        basenames = ['stdin' if logfile == '-' else logfile for logfile, _, _ in logfiles]
+        outputs = [[f"{basename}.ano-{i}{extension}" for i in range(0, args.nproc)] for basename in basenames]
+        filenames = outputs[0]
+        runparams = {name: getattr(args, name) for name in
+                     ['chunksize', 'batchbytes', 'maxlines', 'nproc', 'mapper', 'output', 'compression']}
+        if args.resume:
+            checkpoint = Checkpoint.load(f"{basenames[0]}.ano.checkpoint", runparams)
+            for i, filename in enumerate(filenames):
+                checkpoint.truncate(i, filename, SINKS[args.output].indexname(filename))
+            logging.info(f"Resuming after batch {checkpoint.batches}")
+        else:
+            checkpoint = Checkpoint(f"{basenames[0]}.ano.checkpoint", runparams)
+        acks = Queue() if args.checkpoint > 0 else None
 
-        # 0         1 2 3                     4      5                                         6   7   8   9              10          11       12  13       14  15 16  17                18        19                                      20                                 21                                      22                         23 24     25
-        # 127.0.0.1 - - [30/Jun/2021:07:05:20 +0200] "GET http://xyz.cdn.de/blablabl HTTP/1.1" 200 950 "-" "okhttp/4.9.0" xyz.cdn.com 0.000125 180 upstream hit - 1627 "application/zip" 978608424 "session=-,INT-969498284,-,-; HttpOnly" "Cache-Control:public,max-age=300" "ETag:18ad26753cb3db1be3cf097badf6df5d" "89.204.153.53, 127.0.0.1" - TLSv1.2 c
-        params['equuleus_v2']['usecols'] = [0, 3, 5, 6, 7, 9, 11, 12, 14, 17, 19, 20, 22, 25]
-        params['equuleus_v2']['names'] = ['ip', '#timestamp', 'request', 'statuscode', 'contentlength', 'useragent',
-                               'timefirstbyte',
-                               'timetoserv', 'hit', 'contenttype', 'sessioncookie', 'cachecontrol', 'xforwardedfor',
-                               'side']
-        params['equuleus_v2']['parse_dates'] = ['#timestamp']
-        #                           [22/Feb/2222:22:22:22s
-        params['equuleus_v2']['dateformat'] = '[%d/%b/%Y:%H:%M:%S'
+        # stage timings of the readers and workers, written by this process
+        metrics = Queue() if args.metrics is not None else None
+        exporter = Exporter(args.metrics, metrics, args.metricsinterval) if args.metrics is not None else None
 
+        # create reader and writer processes, the readers share one queue
+        queue = RingBuffer(args.queuelen, args.slotsize) if args.slotsize > 0 else Queue(maxsize=args.queuelen)
+        progress = FileProgress(len(logfiles)) if len(logfiles) > 1 else None
 
+        # lines dropped by their raw bytes before the workers parse them, counted per rule
+        assert args.statuses is None or re.fullmatch(r"\d+-\d+", args.statuses), f"invalid statuses: '{args.statuses}'"
+        prefilter = Prefilter('side' in LOGFORMATS[args.logformat]['names'],
+                              args.methods.split(',') if args.methods else None,
+                              tuple(map(int, args.statuses.split('-'))) if args.statuses else None,
+                              args.allowhosts.split(',') if args.allowhosts else None,
+                              args.denyhosts.split(',') if args.denyhosts else None)
+        if stream:
+            readers = [StreamReader(args.logfile, args.chunksize, args.maxdelay, args.queuelen, args.slotsize,
+                                    args.follow, queue=queue, metrics=metrics, metricsinterval=args.metricsinterval,
+                                    profile=profile)]
+        else:
+            readers = [Reader(logfile, args.chunksize, args.maxlines, args.queuelen, args.decoders, args.slotsize,
+                              args.batchbytes, skip=checkpoint.batches, queue=queue, fileno=fileno, progress=progress,
+                              metrics=metrics, metricsinterval=args.metricsinterval, profile=profile,
+                              decodeahead=args.decodeahead)
+                       for fileno, (logfile, _, _) in enumerate(logfiles)]
 
-        # %<chi>         [%<cqtn>]                   \"%<cqhm> %<cquuc> %<cqpv>\"                                                    %<pssc> %<{Content-Length}psh> \"%<{Referer}cqh>\" \"%<{User-agent}cqh>\" %<{TS_MILESTONE_UA_BEGIN_WRITE-TS_MILESTONE_UA_BEGIN}msdms> %<ttms> %<nhi>        %<chm>   %<{Range}cqh> %<psql> %<psct>   %<cqssv> %<cqssc> %<cqtq> '
-        # 0              1                     2      3                                                                              4       5                      6                    7                8                                                                9       10            11       12            12      14        15       16       17
-        # 93.196.243.158 [22/Feb/2222:22:22:22 -0000] "GET http://xyz.cdn.de/this/is/the/path?and_this_is_the_query_string http/1.1" 200     2152541                "-"                  "Lavf/56.40.101" 7                                                                307     80.156.81.234 TCP_MISS -             2153093 video/mp4 -        -        1645502402.771
-        params['omd']['usecols'] =  [0,   1,            3,         4,            5,               7,           8,                9,            11,    14,         ]
-        params['omd']['names'] =   ['ip', '#timestamp', 'request', 'statuscode', 'contentlength', 'useragent', 'timefirstbyte', 'timetoserv', 'hit', 'contenttype']
-        params['omd']['parse_dates'] = ['#timestamp']
-        #                           [22/Feb/2222:22:22:22
-        params['omd']['dateformat'] = '[%d/%b/%Y:%H:%M:%S'
+        # start worker processes with initializer (worker parameters and secrets)
+        # open raw logfile
+        # create progress bar for file position
+        # create progress bar for processed lines
 
         workers = [
-            Worker(i, f"{args.logfile}.ano-{i}.bz2", reader.queue, mydicts, args.cachename,
-                   args.popname, config['secrets'].getint('timeshiftdays'), config['secrets'].getfloat('xyte'),
+            Worker(i, [files[i] for files in outputs], queue, mydicts, [cachename for _, cachename, _ in logfiles],
+                   [popname for _, _, popname in logfiles], config['secrets'].getint('timeshiftdays'),
+                   config['secrets'].getfloat('xyte'),
                    args.cachesize,
+                   tokenizer=args.tokenizer,
+                   geoindex=args.geoindex,
+                   enrichcache=args.enrichcache,
+                   enrichcachesize=args.enrichcachesize,
+                   output=args.output,
+                   compression=args.compression,
+                   compresslevel=args.compresslevel,
+                   append=args.resume,
+                   checkpoints=acks,
+                   progress=progress,
+                   metrics=metrics,
+                   metricsinterval=args.metricsinterval,
+                   profile=profile,
+                   profileskip=args.profileskip,
+                   profilebatches=args.profilebatches,
+                   prefilter=prefilter,
+                   flushinterval=args.flushinterval if stream else 0,
                    encoding=args.encoding,
                    delimiter=args.delimiter,
                    quotechar=args.quotechar,
@@ -121,33 +331,93 @@ if __name__ == "__main__":
                    escapechar=args.escapechar,
                    header=None,
                    on_bad_lines='skip',
-                   usecols=params['omd']['usecols'],
-                   names=params['omd']['names'],
-                   parse_dates=params['omd']['parse_dates'],
-                   dateformat=params['omd']['dateformat'],
+                   usecols=LOGFORMATS[args.logformat]['usecols'],
+                   names=LOGFORMATS[args.logformat]['names'],
+                   dateformat=LOGFORMATS[args.logformat]['dateformat'],
                    ) for i in range(0, args.nproc)]
 
-        # good to go
+        # good to go, streamed batches are not lost to Ctrl-C
+        handler = signal.signal(signal.SIGINT, signal.SIG_IGN) if stream else None
         list(map(lambda worker: worker.start(), workers))
-        reader.start()
+        if stream:
+            signal.signal(signal.SIGINT, handler)
 
         ######
 
-        # wait for EOF input file
-        reader.join()
-        logging.info(f"{reader.name} finished.")
+        # wait for EOF of the input files, --readers at a time, take checkpoints meanwhile
+        pending = list(readers)
+        running = []
+        lastcheckpoint = time.monotonic()
+        while pending or running:
+            while pending and len(running) < args.readers:
+                running.append(pending.pop(0))
+                running[-1].start()
+
+            try:
+                running[0].join(timeout=1)
+            except KeyboardInterrupt:
+                if not stream:
+                    raise
+                logging.info("Stopping the stream...")
+                list(map(lambda reader: reader.stop(), running))
+            for reader in [reader for reader in running if not reader.is_alive()]:
+                running.remove(reader)
+                logging.info(f"{reader.name} finished.")
+            if exporter is not None:
+                exporter.export()
+
+            if args.checkpoint > 0 and running and time.monotonic() - lastcheckpoint >= args.checkpoint:
+                # the workers sync their outputs and wait, the batches taken are all done
+                list(map(lambda worker: worker.checkpoint(), workers))
+                try:
+                    checkpoint.update(take_acks(acks, workers))
+                except RuntimeError:
+                    # the others wait for proceed() and the readers for the queue, they would hold the exit
+                    list(map(lambda process: process.terminate(), workers + running))
+                    raise
+
+                # mappings of the ids written so far (the hash mapper has none)
+                list(map(lambda mydict, secretsfile: mydict.save(secretsfile), mydicts.values(), secretsfiles))
+                checkpoint.save()
+                list(map(lambda worker: worker.proceed(), workers))
+                logging.info(f"Checkpoint after batch {checkpoint.batches}")
+                lastcheckpoint = time.monotonic()
 
         # signal workers the end and wait for termination
         for worker in workers:
             worker.eof()
         for worker in workers:
-            worker.join(timeout=10)
+            # a worker exits once its last metrics are taken from the queue
+            deadline = time.monotonic() + 10
+            while worker.is_alive() and time.monotonic() < deadline:
+                worker.join(timeout=0.1)
+                if exporter is not None:
+                    exporter.collect()
             logging.info(f"{worker.name} {'timed out' if worker.exitcode is None else 'finished'}.")
+        if exporter is not None:
+            exporter.export(force=True)
+
+        # save mapper secrets (the hash mapper has none)
+        list(map(lambda mydict, secretsfile: mydict.save(secretsfile), mydicts.values(), secretsfiles))
+        for secretsfile in filter(journal.isjournal, secretsfiles):
+            if journal.blocks(secretsfile) >= journal.MAXBLOCKS:
+                journal.compact(secretsfile)
+                logging.info(f"{secretsfile} compacted")
 
-        # save mapper secrets
-        list(map(lambda mydict, prefix: mydict.save(f"secrets/secrets_{prefix}.csv"), mydicts.values(), prefixes))
+        if len(logfiles) == 1:
+            logging.info(f"logfile {args.logfile} anonymization complete")
+            checkpoint.remove()
+        else:
+            logging.info(f"{len(logfiles)} logfiles anonymization complete")
 
-        logging.info(f"logfile {args.logfile} anonymization complete")
+        # merge the worker outputs into one file per logfile, workers without batches of a logfile have no output
+        if args.merge is not None:
+            for basename, files in zip(basenames, outputs):
+                files = list(filter(os.path.exists, files))
+                if files:
+                    merge(files, f"{basename}.ano{extension}", args.output, args.compression, args.compresslevel,
+                          args.merge)
+                    logging.info(f"outputs merged into {basename}.ano{extension}")
 
     except KeyboardInterrupt:
         pass
@@ -155,3 +425,9 @@ if __name__ == "__main__":
         logging.exception("Error in processing")
     finally:
         list(map(lambda manager: manager.shutdown(), managers))
+        if profile is not None:
+            for filename in profiling.merge(profile):
+                logging.info(f"profile written to {filename}")
+        list(map(lambda mydict: mydict.unlink(), filter(lambda mydict: isinstance(mydict, SharedDict), mydicts.values())))
+        if isinstance(queue, RingBuffer):
+            queue.unlink()
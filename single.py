@@ -4,16 +4,18 @@ import argparse
 import configparser
 import bz2
 from tqdm.auto import tqdm
-from datetime import datetime
 import pandas as pd
 import os
-from ua_parser import user_agent_parser
 from geolite2 import geolite2
 from urllib.parse import urlsplit
 from cachetools import cached, LRUCache
-import numpy as np
-from datetime import timedelta
 from anonymizer import MyDict
+from anonymizer.mydict import substitute
+from anonymizer.compression import CODECS, BackgroundWriter
+from anonymizer.sink import CsvSink
+from anonymizer import enrich, timestamps
+from anonymizer.enrich import unique_apply, UACOLUMNS, PATHCOLUMNS
+from functools import partial
 from io import StringIO
 
 if __name__ == "__main__":
@@ -38,6 +40,10 @@ if __name__ == "__main__":
                             help="Additional strings to recognize as NA/NaN. (default: %(default)s)")
         parser.add_argument('--escapechar', type=str, default='\\',
                             help="One-character string used to escape other characters (default: %(default)s)")
+        parser.add_argument('--compression', type=str, default='bz2', choices=list(CODECS),
+                            help="Codec of the output, compressed on a background thread (default: %(default)s)")
+        parser.add_argument('--compresslevel', type=int, default=1,
+                            help="Compression level of the codec (default: %(default)s)")
         parser.add_argument('--configfile', type=str, default='config.ini', help='etc...')
 
         # arguments
@@ -52,7 +58,8 @@ if __name__ == "__main__":
 
         with open(args.logfile, 'rb') as logfile, \
                 bz2.BZ2File(logfile) as logreader, \
-                bz2.BZ2File(f"{args.logfile}.ano.bz2", mode='w', compresslevel=1) as logwriter, \
+                BackgroundWriter(f"{args.logfile}.ano{CsvSink.extension(args.compression)}", args.compression,
+                                 args.compresslevel) as logwriter, \
                 tqdm(total=os.path.getsize(args.logfile), position=0, desc=args.logfile, unit='B',
                      unit_scale=True) as pbar_filepos, \
                 tqdm(position=1, unit='line', desc=args.logfile, unit_scale=True) as pbar_lines:
@@ -73,22 +80,8 @@ if __name__ == "__main__":
             geo = geolite2.reader()
 
 
-            @cached(LRUCache(maxsize=1000))
-            def coord(ip: str) -> str:
-                geodata = geo.get(ip)
-
-                # round up to 2 digits (~1km precision, see https://wiki.openstreetmap.org/wiki/Precision_of_coordinates)
-                return f"{round(geodata['location']['longitude'], 2)}:{round(geodata['location']['latitude'], 2)}" if geodata is not None and 'location' in geodata else np.nan
-
-
-            @cached(LRUCache(maxsize=1000))
-            def uaparser(ua_string: str) -> pd.Series:
-                ps = user_agent_parser.Parse(ua_string)
-                return pd.Series(
-                    [np.nan if x is None else x for x in
-                     [ps['device']['brand'], ps['device']['family'], ps['device']['model'], ps['os']['family'],
-                      ps['user_agent']['family'], ps['user_agent']['major']]]
-                )
+            coord = cached(LRUCache(maxsize=args.cachesize))(partial(enrich.coordinates, geo))
+            uaparser = cached(LRUCache(maxsize=args.cachesize))(enrich.useragent)
 
 
             for chunk in pd.read_csv(logreader,
@@ -106,16 +99,13 @@ if __name__ == "__main__":
 
                                      # 0         1 2 3                     4      5                                         6   7   8   9              10          11       12  13       14  15 16  17                18        19                                      20                                 21                                      22                         23 24     25
                                      # 127.0.0.1 - - [30/Jun/2021:07:05:20 +0200] "GET http://xyz.cdn.de/blablabl HTTP/1.1" 200 950 "-" "okhttp/4.9.0" xyz.cdn.com 0.000125 180 upstream hit - 1627 "application/zip" 978608424 "session=-,INT-969498284,-,-; HttpOnly" "Cache-Control:public,max-age=300" "ETag:18ad26753cb3db1be3cf097badf6df5d" "89.204.153.53, 127.0.0.1" - TLSv1.2 c
-                                     usecols=[0, 3, 5, 6, 7, 9, 10, 11, 12, 14, 17, 19, 20, 22, 25],
-                                     names=['ip', '#timestamp', 'request', 'statuscode', 'contentlength',
+                                     usecols=[0, 3, 4, 5, 6, 7, 9, 10, 11, 12, 14, 17, 19, 20, 22, 25],
+                                     names=['ip', '#timestamp', 'utcoffset', 'request', 'statuscode', 'contentlength',
                                             'useragent', 'host',
                                             'timefirstbyte',
                                             'timetoserv', 'hit', 'contenttype', 'sessioncookie', 'cachecontrol',
                                             'xforwardedfor',
                                             'side'],
-                                     parse_dates=['#timestamp'],
-                                     #                                           [22/Feb/2222:22:22:22s
-                                     date_parser=lambda x: datetime.strptime(x, '[%d/%b/%Y:%H:%M:%S')
                                      ):
 
                 # if logging.level == logging.DEBUG:
@@ -147,6 +137,11 @@ if __name__ == "__main__":
                 chunk.drop(chunk.loc[chunk['side'] != 'c'].index, inplace=True)
                 chunk.drop(['side'], axis=1, inplace=True)
 
+                # nothing left to write, e.g. a chunk of upstream lines only
+                if chunk.empty:
+                    pbar_lines.update(args.chunksize)
+                    continue
+
                 # add constant values
                 chunk['cachename'] = args.cachename
                 chunk['popname'] = args.popname
@@ -155,11 +150,11 @@ if __name__ == "__main__":
                 # parse
 
                 # split xforwarded for, keep the first IP
-                chunk.xforwardedfor = chunk.xforwardedfor.str.split(",", n=1, expand=True)[0]
+                chunk.xforwardedfor = chunk.xforwardedfor.str.split(",", n=1).str[0]
 
                 # remove cache name, if present in host (http redirect)
                 # chunk['host'].replace(r"^[a-zA-Z0-9-]+--", '', inplace=True)
-                chunk.host = chunk.host.str.split("--", n=1, expand=True)[0]
+                chunk.host = unique_apply(chunk.host, lambda hosts: hosts.str.split("--", n=1).str[0])
 
                 # check if all public
                 assert True  # TODO: implement
@@ -187,28 +182,23 @@ if __name__ == "__main__":
                 chunk.drop(['url'], axis=1, inplace=True)
 
                 # session cookie
-                dummy = chunk['sessioncookie'].str.extract(
-                    r"session=(?:-|([^,]+)),(?:-|([^,]+)),", expand=True)
-                chunk['uid'] = dummy[0]
-                chunk['sid'] = dummy[1]
+                chunk[['uid', 'sid']] = unique_apply(
+                    chunk['sessioncookie'],
+                    lambda cookies: cookies.str.extract(r"session=(?:-|([^,]+)),(?:-|([^,]+)),", expand=True)).values
                 chunk.drop(['sessioncookie'], axis=1, inplace=True)
 
-                # channel number (.fillna().sum() takes care of the OR case in the regexp)
-                chunk['livechannel'] = chunk['path'].str.extract(r'PLTV/88888888/\d+/(\d+)/|([^/]+)\.isml',
-                                                                 expand=False).fillna('').sum(axis=1).replace('',
-                                                                                                              np.NaN)
-
-                # contentpackage, assetid
-                dummy = chunk['path'].str.extract(r"/(\d{18,})/(\d{16,})/")
-                chunk['contentpackage'] = dummy[0]
-                chunk['assetnumber'] = dummy[1]
+                # channel number, contentpackage, assetid, streaming protocol (added after the user agent columns)
+                pathcolumns = unique_apply(chunk['path'], enrich.path)
+                chunk[PATHCOLUMNS[:3]] = pathcolumns[PATHCOLUMNS[:3]]
 
                 # cache control
-                chunk['maxage'] = chunk['cachecontrol'].str.extract(r'max-age=(\d+)', expand=False)
+                chunk['maxage'] = unique_apply(chunk['cachecontrol'],
+                                               lambda cachecontrols: cachecontrols.str.extract(r'max-age=(\d+)',
+                                                                                               expand=False))
 
                 #########################
                 # enrich - geoip, use local cache for performance
-                chunk['coordinates'] = chunk['ip'].map(coord, na_action='ignore')
+                chunk['coordinates'] = unique_apply(chunk['ip'], lambda ips: ips.map(coord))
                 chunk.drop(['ip'], axis=1, inplace=True)
 
                 logging.debug(chunk.head(5))
@@ -216,19 +206,16 @@ if __name__ == "__main__":
                 #########################
                 # enrich - user agent, use local cache for performance
 
-                chunk[["devicebrand", "devicefamily", "devicemodel", "osfamily", "uafamily", "uamajor"]] = \
-                    chunk.loc[
-                        chunk['useragent'].notna(), 'useragent'].apply(uaparser)
+                chunk[UACOLUMNS] = unique_apply(
+                    chunk['useragent'],
+                    lambda uas: pd.DataFrame([uaparser(ua) for ua in uas], columns=UACOLUMNS, index=uas.index))
                 chunk.drop(['useragent'], axis=1, inplace=True)
 
                 logging.debug(chunk.head(5))
 
                 #########################
                 # enrich - streaming protocol
-
-                chunk['manifest'] = chunk['path'].str.match(r'(?:\.isml?/Manifest|\.mpd|\.m3u8)$', case=False)
-                chunk['fragment'] = chunk['path'].str.match(
-                    r'(?:\.m4[avi]|\.ts|\.ism[av]|\.mp[4a]|/(?:Fragments|KeyFrames)\(.*\))$', case=False)
+                chunk[['manifest', 'fragment']] = pathcolumns[['manifest', 'fragment']]
 
                 #########################
                 # anonymize
@@ -238,12 +225,12 @@ if __name__ == "__main__":
                                'devicefamily', 'devicemodel', 'osfamily', 'uafamily', 'uamajor', 'path',
                                'livechannel', 'contentpackage', 'assetnumber', 'uid', 'sid']:
                     assert prefix in mydicts, f"Mapper prefix issue: '{prefix}' not found in '{mydicts}'"
-                    chunk[prefix] = chunk[prefix].map(mydicts[prefix].map, na_action='ignore')
+                    chunk[prefix] = substitute(chunk[prefix], mydicts[prefix])
 
                 logging.debug(chunk.head(5))
 
-                # shift time
-                chunk['#timestamp'] += timedelta(days=config['secrets'].getint('timeshiftdays'))
+                # parse and shift time, each distinct timestamp once
+                timestamps.convert(chunk, '[%d/%b/%Y:%H:%M:%S', config['secrets'].getint('timeshiftdays'))
 
                 # convert byte to xyte
                 chunk.contentlength = chunk.contentlength.divide(config['secrets'].getfloat('xyte'))
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from anonymizer.sink import ArrowSink, ParquetSink
+
+
+def chunk(contenttype, host, utcoffset) -> pd.DataFrame:
+    df = pd.DataFrame({'#timestamp': pd.to_datetime(['2021-06-30 07:05:20', '2021-06-30 07:05:21']),
+                       'contenttype': contenttype, 'host': host,
+                       'utcoffset': pd.array(utcoffset, dtype='Int16'), 'contentlength': [0.5, 1.0]})
+    return df.set_index(['#timestamp', 'contenttype', 'host', 'utcoffset'])
+
+
+def test_all_nan_first_batch(tmp_path):
+    # the types come from the roles of the columns, not from the values of the first batch
+    for sink, read in [(ArrowSink, lambda f: pa.ipc.open_stream(f).read_all()), (ParquetSink, pq.read_table)]:
+        filename = str(tmp_path / f"out{sink.EXTENSION}")
+        with sink(filename, mapped=['host'], numericids=True) as s:
+            s.write(chunk([np.nan, np.nan], [np.nan, np.nan], [None, None]), 0)
+            s.write(chunk(['video/mp4', np.nan], [1, 2], [120, -60]), 1)
+
+        table = read(filename)
+        assert table.schema.field('contenttype').type == pa.dictionary(pa.int32(), pa.string())
+        assert table.schema.field('host').type == pa.int64()
+        assert table.schema.field('utcoffset').type == pa.int16()
+        assert table.schema.field('#timestamp').type == pa.timestamp('ns')
+        assert table.column('contenttype').to_pylist() == [None, None, 'video/mp4', None]
+        assert table.column('host').to_pylist() == [None, None, 1, 2]
+        assert table.column('utcoffset').to_pylist() == [None, None, 120, -60]